@@ -26,13 +26,12 @@ def main():
 
     # 2. If RAG enabled, create store/indexer/retriever and register eviction callback
     # store = EvictedStore(args.index_path)
-    # indexer = Indexer(args.index_path)
+    # indexer = Indexer(args.index_path, background=True)  # index off the generation thread
     # retriever = Retriever(indexer)
 
     # def on_evict(segment):
     #     sid = store.add_segment(segment)
-    #     indexer.add_segment({**segment, "id": sid})
-    #     indexer.save()
+    #     indexer.add_segment({**segment, "id": sid})  # enqueue only, never blocks
 
     # kv_cache.set_eviction_callback(on_evict)
 
@@ -41,6 +40,10 @@ def main():
     #     passages = retriever.retrieve(query_text)
     #     reintegrate_passages(model, tokenizer, passages)
 
+    # 4. On shutdown, drain the indexing queue and persist
+    # indexer.close()
+    # indexer.save()
+
     print("This is a skeleton runner for streaming + RAG. Fill in wiring as needed.")
 
 
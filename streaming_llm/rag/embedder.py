@@ -0,0 +1,278 @@
+"""Text embedders used by the indexer.
+
+`Indexer` only relies on a SentenceTransformer-like `encode` method, so any
+sentence-transformers model can be plugged in. `HashingEmbedder` is a small
+dependency-free default (signed feature hashing over word tokens) that keeps
+the RAG pipeline usable offline and in tests. `EmbeddingCache` memoizes
+vectors by content hash so repeated evictions are never re-encoded, and
+`simhash` fingerprints text so near-duplicates can be rejected before that.
+`load_reranker` resolves the optional cross-encoder used by `Retriever`.
+`CudaPrefetchEmbedder` wraps a sentence-transformers model living on a GPU
+so the host-to-device copy of the next batch overlaps the current forward.
+"""
+import hashlib
+import re
+import sqlite3
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class HashingEmbedder:
+    """Bag-of-words embedder using the signed hashing trick.
+
+    Hashes are computed with crc32 so vectors are stable across processes,
+    which matters once an index is persisted and reloaded.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self.model_id = f"hashing-{dim}"
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(
+        self,
+        sentences: Union[str, List[str]],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        normalize_embeddings: bool = False,
+        **kwargs,
+    ) -> np.ndarray:
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        out = np.zeros((len(sentences), self.dim), dtype=np.float32)
+        for row, text in enumerate(sentences):
+            for token in _TOKEN_RE.findall((text or "").lower()):
+                h = zlib.crc32(token.encode("utf-8"))
+                out[row, h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        if normalize_embeddings:
+            norms = np.linalg.norm(out, axis=1, keepdims=True)
+            out /= np.maximum(norms, 1e-12)
+        return out
+
+
+def load_embedder(embedder: Optional[Any] = None, dim: int = 384) -> Any:
+    """Resolve `embedder` into an object exposing `encode`.
+
+    `None` gives a `HashingEmbedder`; a string is treated as a
+    sentence-transformers model name; anything else is returned as-is.
+    """
+    if embedder is None:
+        return HashingEmbedder(dim=dim)
+    if isinstance(embedder, str):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "sentence-transformers is required to load embedder "
+                f"'{embedder}': pip install sentence-transformers"
+            ) from e
+        model = SentenceTransformer(embedder)
+        # Two models of the same dimension must not share cached embeddings.
+        model.model_id = embedder
+        if str(getattr(model, "device", "cpu")).startswith("cuda"):
+            return CudaPrefetchEmbedder(model)
+        return model
+    return embedder
+
+
+class CudaPrefetchEmbedder:
+    """Encode with a CUDA SentenceTransformer, prefetching batches on a side stream.
+
+    Each batch is tokenized into pinned host memory and copied to the device
+    with `non_blocking=True` on a dedicated copy stream, issued before the
+    previous batch's forward pass so the transfer hides behind compute.
+    Embeddings stay on the device until the last batch is done.
+    """
+
+    def __init__(self, model):
+        import torch
+
+        self._torch = torch
+        self.model = model
+        self.device = model.device
+        self.model_id = embedder_id(model)
+        self._copy_stream = torch.cuda.Stream(device=self.device)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def _prefetch(self, texts: List[str]) -> Dict[str, Any]:
+        torch = self._torch
+        features = self.model.tokenize(texts)
+        with torch.cuda.stream(self._copy_stream):
+            return {
+                k: v.pin_memory().to(self.device, non_blocking=True) if torch.is_tensor(v) else v
+                for k, v in features.items()
+            }
+
+    def encode(
+        self,
+        sentences: Union[str, List[str]],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        normalize_embeddings: bool = False,
+        **kwargs,
+    ) -> np.ndarray:
+        torch = self._torch
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        if not sentences:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+        batches = [sentences[i:i + batch_size] for i in range(0, len(sentences), batch_size)]
+        compute = torch.cuda.current_stream(self.device)
+        out = []
+        with torch.inference_mode():
+            ready = self._prefetch(batches[0])
+            for i in range(len(batches)):
+                compute.wait_stream(self._copy_stream)
+                features = ready
+                for v in features.values():
+                    if torch.is_tensor(v):
+                        v.record_stream(compute)
+                if i + 1 < len(batches):
+                    ready = self._prefetch(batches[i + 1])
+                emb = self.model(features)["sentence_embedding"]
+                if normalize_embeddings:
+                    emb = torch.nn.functional.normalize(emb, p=2, dim=1)
+                out.append(emb)
+        return torch.cat(out).float().cpu().numpy()
+
+
+def load_reranker(reranker: Optional[Any] = None) -> Any:
+    """Resolve `reranker` into an object exposing CrossEncoder-style `predict`.
+
+    A string is treated as a sentence-transformers cross-encoder model name,
+    loaded in half precision when it lands on a GPU.
+    """
+    if not isinstance(reranker, str):
+        return reranker
+    try:
+        from sentence_transformers import CrossEncoder
+    except ImportError as e:
+        raise ImportError(
+            "sentence-transformers is required to load reranker "
+            f"'{reranker}': pip install sentence-transformers"
+        ) from e
+    model = CrossEncoder(reranker)
+    if str(getattr(model, "device", "cpu")).startswith("cuda"):
+        model.model.half()
+    return model
+
+
+def embedder_id(embedder: Any) -> str:
+    """Return a stable identifier for `embedder`, used to namespace caches."""
+    model_id = getattr(embedder, "model_id", None)
+    if model_id:
+        return str(model_id)
+    card = getattr(embedder, "model_card_data", None)
+    name = getattr(card, "base_model", None) or type(embedder).__name__
+    get_dim = getattr(embedder, "get_sentence_embedding_dimension", None)
+    return f"{name}-{get_dim()}" if get_dim is not None else name
+
+
+def simhash(text: Optional[str], shingle: int = 1) -> int:
+    """Return the 64-bit SimHash of `text` over word `shingle`-grams.
+
+    Texts that differ by a few words get fingerprints a small Hamming
+    distance apart, unlike a cryptographic hash. Single words (the default)
+    keep that distance lowest for one-word edits; longer shingles also
+    separate reorderings but spread each edit over more features.
+    """
+    tokens = _TOKEN_RE.findall((text or "").lower())
+    grams = [" ".join(tokens[i:i + shingle]) for i in range(max(1, len(tokens) - shingle + 1))]
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "little") for g in grams],
+        dtype=np.uint64,
+    )
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(grams)
+    return int(np.packbits(votes > 0, bitorder="little").view("<u8")[0])
+
+
+def hamming_distances(hashes: np.ndarray, h: int) -> np.ndarray:
+    """Return the Hamming distance between each uint64 in `hashes` and `h`."""
+    xor = np.bitwise_xor(hashes, np.uint64(h))
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(xor)
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class EmbeddingCache:
+    """Embedding cache keyed by `(model_id, sha256(normalized text))`.
+
+    Backed by a sqlite file when `path` is given, otherwise by an in-memory
+    LRU of at most `max_entries` vectors, so an unbounded stream of segments
+    does not keep a float32 copy of each one.
+    """
+
+    _CHUNK = 500  # stay below sqlite's bound-parameter limit
+
+    def __init__(self, path: Optional[str] = None, model_id: str = "default", max_entries: int = 4096):
+        self.path = path
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._mem: "OrderedDict[str, bytes]" = OrderedDict()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, key TEXT NOT NULL, vec BLOB NOT NULL, "
+                "PRIMARY KEY (model, key))"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def key(text: Optional[str]) -> str:
+        normalized = " ".join((text or "").split())
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Return cached vectors for the subset of `keys` that is present."""
+        keys = list(dict.fromkeys(keys))
+        if self._db is None:
+            found = {k: self._mem[k] for k in keys if k in self._mem}
+            for k in found:
+                self._mem.move_to_end(k)
+        else:
+            found = {}
+            for i in range(0, len(keys), self._CHUNK):
+                chunk = keys[i:i + self._CHUNK]
+                rows = self._db.execute(
+                    "SELECT key, vec FROM embeddings WHERE model = ? AND key IN (%s)"
+                    % ",".join("?" * len(chunk)),
+                    (self.model_id, *chunk),
+                )
+                found.update(rows)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return {k: np.frombuffer(v, dtype=np.float32) for k, v in found.items()}
+
+    def put_many(self, items: Iterable[Tuple[str, np.ndarray]]) -> None:
+        rows = [(k, np.asarray(v, dtype=np.float32).tobytes()) for k, v in items]
+        if self._db is None:
+            self._mem.update(rows)
+            for k, _ in rows:
+                self._mem.move_to_end(k)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+            return
+        self._db.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, key, vec) VALUES (?, ?, ?)",
+            [(self.model_id, k, v) for k, v in rows],
+        )
+        self._db.commit()
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
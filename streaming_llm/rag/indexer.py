@@ -1,34 +1,906 @@
-"""Incremental indexer wrapper for evicted segments (skeleton).
+"""Incremental indexer wrapper for evicted segments.
 
-This module should wrap a vector store or index (FAISS, LlamaIndex, etc.).
-It provides methods to add segments and query the index.
+Segments are embedded with a SentenceTransformer-compatible embedder and added
+to a vector index using inner product over normalized vectors (i.e. cosine
+similarity). The index is a FAISS HNSW graph when faiss is installed, or a
+`FlatIndex` that keeps all vectors in one contiguous float32 matrix and scores
+a query with a single BLAS matrix-vector product. A parallel list keeps the
+segment dicts so that search hits can be mapped back to their text and metadata.
+Stored vectors can be kept in float16 or int8 (`precision`) to halve or
+quarter the memory traffic of each query.
+
+Segments are embedded in micro-batches: `add_segment` queues the segment and
+the queue is flushed through a single `encode` call once `batch_size` segments
+are pending, `flush_interval` seconds have passed, or before any read.
+Vectors are looked up in a content-hash `EmbeddingCache` first, so duplicate
+segments (repeated prompts, boilerplate) skip the encoder entirely.
+
+With `block_size`, segments are split into fixed-size word blocks that are
+deduplicated by content hash before indexing: overlapping evictions (shared
+system prompt, same document head) store and embed each common block once,
+and segment scores are the max over their blocks.
+
+`load` memory-maps both the vector index and the JSON-lines metadata log, so
+opening a large index is near-instant and only pages touched by a search are
+read from disk.
+
+With the faiss backend, `scale` picks the index structure for the expected
+corpus size: exact "Flat" search (small), an HNSW graph (medium) or IVF-PQ
+(large). Under `scale="auto"` the index starts flat and is rebuilt with the
+next structure whenever the vector count doubles past a scale limit. The
+rebuild runs on its own thread and is swapped in once trained, so adds and
+queries are never blocked on it.
+
+With `dedup_distance`, each segment's 64-bit SimHash is compared against all
+indexed segments in one vectorized XOR/popcount, and segments within that
+Hamming distance of an existing one are not indexed at all: `add_segment`
+returns the existing entry's id instead of paying for another encode.
+
+With `background=True`, embedding and indexing run on a daemon worker thread
+fed by a bounded queue, so an eviction callback only pays for an enqueue;
+reads and `flush` wait for the queue to drain first.
+
+`fingerprint` is a SHA-256 chained over the indexed segments, saved with the
+index, so results cached outside the process can be keyed by index content
+rather than by size.
 """
-from typing import List, Dict, Optional
+import functools
+import hashlib
+import json
+import mmap
+import os
+import queue
+import threading
+import time
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+try:
+    import faiss
+except ImportError:  # pragma: no cover - optional dependency
+    faiss = None
+
+try:
+    from numba import njit, prange
+except ImportError:  # pragma: no cover - optional dependency
+    njit = None
+
+from .embedder import EmbeddingCache, embedder_id, hamming_distances, load_embedder, simhash
+
+INDEX_FILE = "faiss.idx"
+FLAT_FILE = "embeddings.npy"
+META_FILE = "meta.jsonl"
+META_OFFSETS_FILE = "meta_offsets.npy"
+BLOCKS_FILE = "blocks.json"
+CACHE_FILE = "emb_cache.db"
+SIMHASH_FILE = "simhash.npy"
+FINGERPRINT_FILE = "fingerprint.txt"
+
+_STOP = object()  # sentinel that stops the background worker
+
+SCALES = ("auto", "small", "medium", "large")
+# Largest corpus each scale is chosen for under scale="auto".
+SCALE_LIMITS = {"small": 100_000, "medium": 10_000_000}
+# IVF-PQ needs enough vectors to train its coarse and product quantizers;
+# a "large" index stays flat until it holds this many. At 4*sqrt(N) lists,
+# faiss's minimum of 39 training points per list is met from about 24k.
+IVF_MIN_TRAIN = 1 << 15
+IVF_TRAIN_PER_LIST = 64  # training sample size per inverted list
+PQ_NBITS = 8  # bits per product-quantizer sub-code
+
+
+PRECISIONS = ("float32", "float16", "int8")
+# int8 vectors are unit-normalized, so every component fits a fixed [-1, 1] range.
+INT8_SCALE = 127.0
+
+
+if njit is not None:
+
+    @njit(parallel=True, fastmath=True)
+    def _int8_scores(emb, queries, out):
+        # Dequantize-and-dot in one pass, without a float32 copy of `emb`.
+        n, d = emb.shape
+        for i in prange(n):
+            for r in range(queries.shape[0]):
+                s = np.float32(0.0)
+                for j in range(d):
+                    s += emb[i, j] * queries[r, j]
+                out[r, i] = s
+
+else:  # pragma: no cover
+    _int8_scores = None
+
+
+class FlatIndex:
+    """Exact inner-product index over a growable `(N, dim)` matrix.
+
+    Vectors are stored as `dtype` (float32, float16 or int8) and dequantized
+    to float32 one block at a time during search, so low-precision storage
+    cuts bytes read per query without a full float32 copy of the matrix.
+    When numba is installed, int8 scores come from a compiled parallel
+    kernel that fuses dequantization into the dot product.
+    Mirrors the subset of the FAISS index API used by `Indexer` (`ntotal`,
+    `add`, `search`) so either can back it.
+    """
+
+    _MIN_CAPACITY = 1024
+    _BLOCK = 16384
+
+    def __init__(self, dim: int, dtype: str = "float32"):
+        if str(dtype) not in PRECISIONS:
+            raise ValueError(f"Unsupported precision: {dtype}")
+        self.d = dim
+        self.dtype = np.dtype(dtype)
+        self.ntotal = 0
+        self._emb = np.empty((0, dim), dtype=self.dtype)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._emb[:self.ntotal]
+
+    def _quantize(self, vecs: np.ndarray) -> np.ndarray:
+        if self.dtype == np.int8:
+            return np.clip(np.rint(vecs * INT8_SCALE), -127, 127).astype(np.int8)
+        return vecs.astype(self.dtype, copy=False)
+
+    def add(self, vecs: np.ndarray) -> None:
+        vecs = self._quantize(np.asarray(vecs, dtype=np.float32).reshape(-1, self.d))
+        needed = self.ntotal + len(vecs)
+        if needed > len(self._emb):
+            capacity = max(needed, 2 * len(self._emb), self._MIN_CAPACITY)
+            grown = np.empty((capacity, self.d), dtype=self.dtype)
+            grown[:self.ntotal] = self.vectors
+            self._emb = grown
+        self._emb[self.ntotal:needed] = vecs
+        self.ntotal = needed
+
+    def search(self, queries: np.ndarray, k: int):
+        """Return `(scores, ids)` arrays of shape `(len(queries), k)`."""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.d)
+        k = min(k, self.ntotal)
+        if k <= 0:
+            empty = np.empty((len(queries), 0))
+            return empty.astype(np.float32), empty.astype(np.int64)
+        scores = np.empty((len(queries), self.ntotal), dtype=np.float32)
+        if self.dtype == np.int8 and _int8_scores is not None:
+            _int8_scores(self.vectors, queries, scores)
+        else:
+            for start in range(0, self.ntotal, self._BLOCK):
+                block = self._emb[start:min(start + self._BLOCK, self.ntotal)]
+                scores[:, start:start + len(block)] = queries @ block.astype(np.float32, copy=False).T
+        if self.dtype == np.int8:
+            scores *= 1.0 / INT8_SCALE
+        if k < self.ntotal:
+            ids = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            ids = np.broadcast_to(np.arange(self.ntotal), scores.shape)
+        top = np.take_along_axis(scores, ids, axis=1)
+        order = np.argsort(-top, axis=1)
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+    def save(self, path: str) -> None:
+        _atomic_write(path, lambda f: np.save(f, self.vectors))
+
+    @classmethod
+    def load(cls, path: str, use_mmap: bool = False) -> "FlatIndex":
+        """Load vectors from `path`; with `use_mmap` they are paged in on demand.
+
+        A mapped matrix is copied into memory on the first `add`.
+        """
+        vecs = np.load(path, mmap_mode="r" if use_mmap else None)
+        index = cls(vecs.shape[1], dtype=vecs.dtype.name)
+        index._emb = vecs
+        index.ntotal = len(vecs)
+        return index
+
+
+class JsonlMeta:
+    """List-like segment metadata persisted as JSON lines plus an offset table.
+
+    Saved entries are read lazily through mmap: `offsets[i]` is the byte
+    offset of line `i`, so `meta[i]` decodes a single line. Entries appended
+    since the last save are kept in memory and appended to the log by `save`.
+    """
+
+    def __init__(self):
+        self._mm = None
+        self._offsets = np.zeros(1, dtype=np.uint64)
+        self._new: List[Dict] = []
+
+    def _saved(self) -> int:
+        return len(self._offsets) - 1
+
+    def __len__(self) -> int:
+        return self._saved() + len(self._new)
+
+    def __getitem__(self, i: int) -> Dict:
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        saved = self._saved()
+        if i >= saved:
+            return dict(self._new[i - saved])
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return json.loads(self._mm[start:end])
+
+    def append(self, item: Dict) -> None:
+        self._new.append(item)
+
+    def extend(self, items: List[Dict]) -> None:
+        self._new.extend(items)
+
+    def save(self, log_path: str, offsets_path: str) -> None:
+        """Append unsaved entries to `log_path` and rewrite the offset table."""
+        if self._mm is None:
+            self._offsets = np.zeros(1, dtype=np.uint64)
+        lines = [
+            (json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8")
+            for item in self._new
+        ]
+        with open(log_path, "ab" if self._mm is not None else "wb") as f:
+            f.writelines(lines)
+        sizes = np.fromiter((len(line) for line in lines), dtype=np.uint64, count=len(lines))
+        self._offsets = np.concatenate([self._offsets, self._offsets[-1] + np.cumsum(sizes)])
+        _atomic_write(offsets_path, lambda f: np.save(f, self._offsets))
+        self._new = []
+        self._map(log_path)
+
+    @classmethod
+    def load(cls, log_path: str, offsets_path: str) -> "JsonlMeta":
+        meta = cls()
+        meta._offsets = np.load(offsets_path, mmap_mode="r")
+        meta._map(log_path)
+        return meta
+
+    def _map(self, log_path: str) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._offsets[-1] > 0:
+            with open(log_path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _normalize(vecs: np.ndarray) -> np.ndarray:
+    """L2-normalize the rows of `vecs` in place and return it.
+
+    Only for raw vectors handed in by a caller: the indexer's own embeddings
+    come back unit-length from the encoder (`normalize_embeddings=True`), so
+    every search is a plain inner product with no per-candidate norm.
+    """
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-12
+    return vecs
+
+
+def _chain_fingerprint(fingerprint: str, segments) -> str:
+    """Fold `segments` into the running content `fingerprint`."""
+    h = hashlib.sha256(fingerprint.encode("ascii"))
+    for seg in segments:
+        h.update(json.dumps(seg, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+def _atomic_write(path: str, write) -> None:
+    # Write next to `path` and rename, so readers (or live mmaps) of the old
+    # file never observe a truncated one.
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def _make_faiss_index(dim: int, hnsw_m: int, precision: str):
+    if precision == "float32":
+        return faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+    qtype = {
+        "float16": faiss.ScalarQuantizer.QT_fp16,
+        "int8": faiss.ScalarQuantizer.QT_8bit_uniform,
+    }[precision]
+    index = faiss.IndexHNSWSQ(dim, qtype, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        # Normalized vectors span [-1, 1]; train the uniform quantizer on that range.
+        index.train(np.array([[-1.0] * dim, [1.0] * dim], dtype=np.float32))
+    return index
+
+
+def _ivf_nlist(n: int, n_train: int) -> int:
+    """Return 4*sqrt(n) IVF lists, capped so `n_train` points give each the 39 faiss needs."""
+    return max(1, min(4 * int(np.sqrt(n)), n_train // 39))
+
+
+def _make_scaled_index(
+    dim: int, scale: str, hnsw_m: int, precision: str, sample: np.ndarray = None, n: int = None
+):
+    """Build the faiss index for `scale` through `faiss.index_factory`.
+
+    "large" builds `IVF{4*sqrt(n)},PQ{m}x{nbits}` for a corpus of `n` vectors
+    (default `len(sample)`), trained on `sample`; the other scales honour
+    `precision` like `_make_faiss_index`.
+    """
+    if scale == "medium":
+        return _make_faiss_index(dim, hnsw_m, precision)
+    if scale == "large":
+        nlist = _ivf_nlist(len(sample) if n is None else n, len(sample))
+        index = faiss.index_factory(dim, f"IVF{nlist},PQ{np.gcd(dim, 64)}x{PQ_NBITS}", faiss.METRIC_INNER_PRODUCT)
+        index.train(sample)
+        index.nprobe = max(1, nlist // 16)
+        return index
+    factory = {"float32": "Flat", "float16": "SQfp16", "int8": "SQ8"}[precision]
+    index = faiss.index_factory(dim, factory, faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        index.train(np.array([[-1.0] * dim, [1.0] * dim], dtype=np.float32))
+    return index
+
+
+def _index_scale(index) -> str:
+    if isinstance(index, faiss.IndexIVF):
+        return "large"
+    if isinstance(index, faiss.IndexHNSW):
+        return "medium"
+    return "small"
 
 
 class Indexer:
-    def __init__(self, index_path: str = None):
+    def __init__(
+        self,
+        index_path: str = None,
+        embedder=None,
+        dim: int = 384,
+        backend: str = "auto",
+        hnsw_m: int = 32,
+        precision: str = "float32",
+        batch_size: int = 64,
+        flush_interval: float = 1.0,
+        cache: bool = True,
+        block_size: int = 0,
+        query_cache_size: int = 1024,
+        background: bool = False,
+        queue_size: int = 1024,
+        scale: str = None,
+        dedup_distance: Optional[int] = None,
+    ):
         """Initialize indexer. Optionally load existing index from `index_path`.
+
+        `embedder` may be an object with an `encode` method, a
+        sentence-transformers model name, or None for the built-in hashing
+        embedder of size `dim`. With `cache`, embeddings are memoized by
+        content hash (on disk under `index_path` when one is given).
+        `backend` is "faiss", "numpy" or "auto" (faiss when installed).
+        `precision` selects how stored vectors are encoded: "float32",
+        "float16" or "int8" (scalar-quantized over [-1, 1]). A positive
+        `block_size` indexes deduplicated blocks of that many words instead
+        of whole segments. Up to `query_cache_size` query embeddings are
+        kept in an LRU cache so repeated queries skip the encoder.
+        `scale` ("small", "medium", "large" or "auto") selects a faiss index
+        structure by corpus size instead of the default HNSW graph.
+        With `dedup_distance` (e.g. 4), segments whose SimHash is within that
+        many bits of an indexed segment are skipped as near-duplicates.
+
+        With `background`, `add_segment` only enqueues the segment (up to
+        `queue_size`, dropping and counting segments beyond that) and a
+        daemon thread embeds and indexes them, keeping that work off the
+        generation thread. Call `close` to stop the thread.
         """
+        if backend == "auto":
+            backend = "faiss" if faiss is not None else "numpy"
+        if backend not in ("faiss", "numpy"):
+            raise ValueError(f"Unknown index backend: {backend}")
+        if backend == "faiss" and faiss is None:
+            raise ImportError("faiss is required for the faiss backend: pip install faiss-cpu")
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unsupported precision: {precision}")
+        if scale is not None and scale not in SCALES:
+            raise ValueError(f"Unknown index scale: {scale}")
+        if scale is not None and backend != "faiss":
+            raise ValueError("scale requires the faiss backend")
+        self.backend = backend
         self.index_path = index_path
-        # internal state / vector index handle
+        self.embedder = load_embedder(embedder, dim=dim)
+        get_dim = getattr(self.embedder, "get_sentence_embedding_dimension", None)
+        self.dim = get_dim() if get_dim is not None else dim
+        self.scale = scale
+        self.hnsw_m = hnsw_m
+        self.precision = precision
+        self._rescale_at = 0
+        self._rescaler: Optional[threading.Thread] = None
+        self._rescale_error: Optional[BaseException] = None
+        if scale is not None:
+            initial = "medium" if scale == "medium" else "small"
+            self._index = _make_scaled_index(self.dim, initial, hnsw_m, precision)
+            self._rescale_at = 1024
+        elif backend == "faiss":
+            self._index = _make_faiss_index(self.dim, hnsw_m, precision)
+        else:
+            self._index = FlatIndex(self.dim, dtype=precision)
+        self._meta = JsonlMeta()
+        self._fingerprint = ""
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending: List[Dict] = []
+        self._pending_since = 0.0
+        # Segments whose indexing failed; retried ahead of anything newer so
+        # entry ids keep matching index positions.
+        self._failed: List[Dict] = []
+        self._n_added = 0
+        self.block_size = block_size
+        self._block_ids: Dict[str, int] = {}
+        self._block_segments: List[List[int]] = []
+        self.dedup_distance = dedup_distance
+        self._simhashes = np.zeros(0, dtype=np.uint64)
+        self._simhash_ids: List[int] = []
+        self._embed_query = functools.lru_cache(maxsize=query_cache_size)(self._embed_query_uncached)
+        # `_lock` guards index state; `_id_lock` orders id assignment and
+        # enqueueing so entry ids match positions in the index.
+        self._lock = threading.RLock()
+        self._id_lock = threading.Lock()
+        self._cache = None
+        if cache:
+            cache_path = None
+            if index_path:
+                os.makedirs(index_path, exist_ok=True)
+                cache_path = os.path.join(index_path, CACHE_FILE)
+            self._cache = EmbeddingCache(cache_path, model_id=embedder_id(self.embedder))
+        if index_path and os.path.exists(self._index_file()):
+            self.load()
+        self.dropped = 0
+        self._worker_error: Optional[BaseException] = None
+        self._queue = None
+        self._thread = None
+        if background:
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._thread = threading.Thread(target=self._worker, name="rag-indexer", daemon=True)
+            self._thread.start()
+
+    def _index_file(self) -> str:
+        return os.path.join(self.index_path, INDEX_FILE if self.backend == "faiss" else FLAT_FILE)
+
+    def __len__(self) -> int:
+        return self._n_added
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        vecs = self.embedder.encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        )
+        return np.ascontiguousarray(vecs, dtype=np.float32).reshape(len(texts), self.dim)
+
+    def _embed_query_uncached(self, text: str) -> np.ndarray:
+        vec = self._embed([text])
+        vec.setflags(write=False)
+        return vec
+
+    def _embed_cached(self, texts: List[str]) -> np.ndarray:
+        if self._cache is None:
+            return self._embed(texts)
+        keys = [EmbeddingCache.key(t) for t in texts]
+        found = self._cache.get_many(keys)
+        missing = {k: t for k, t in zip(keys, texts) if k not in found}
+        if missing:
+            vecs = self._embed(list(missing.values()))
+            new = dict(zip(missing, vecs))
+            self._cache.put_many(new.items())
+            found.update(new)
+        return np.stack([found[k] for k in keys])
+
+    def add_segment(self, segment: Dict) -> Optional[str]:
+        """Queue a segment for indexing and return its entry id.
+
+        In background mode, returns None if the queue is full and the
+        segment was dropped. A near-duplicate (see `dedup_distance`) is not
+        queued and the id of the segment it duplicates is returned.
+        """
+        with self._id_lock:
+            h = None
+            if self.dedup_distance is not None:
+                h = simhash(segment.get("text"))
+                dup = self._find_near_duplicate(h)
+                if dup is not None:
+                    return dup
+            if self._queue is not None:
+                try:
+                    self._queue.put_nowait(dict(segment))
+                except queue.Full:
+                    self.dropped += 1
+                    return None
+            else:
+                with self._lock:
+                    if not self._pending:
+                        self._pending_since = time.monotonic()
+                    self._pending.append(dict(segment))
+            entry_id = str(self._n_added)
+            self._remember_simhash(h, self._n_added)
+            self._n_added += 1
+        if self._queue is None:
+            self._maybe_flush()
+        return entry_id
+
+    def add_segments(self, segments: List[Dict]) -> List[str]:
+        """Index a batch of segments with a single embedder call.
+
+        Returns once the segments are searchable, also in background mode.
+        """
+        ids = []
+        with self._id_lock:
+            batch = []
+            for seg in segments:
+                h = None
+                if self.dedup_distance is not None:
+                    h = simhash(seg.get("text"))
+                    dup = self._find_near_duplicate(h)
+                    if dup is not None:
+                        ids.append(dup)
+                        continue
+                ids.append(str(self._n_added))
+                self._remember_simhash(h, self._n_added)
+                self._n_added += 1
+                batch.append(dict(seg))
+            if self._queue is not None:
+                for seg in batch:
+                    self._queue.put(seg)
+            else:
+                with self._lock:
+                    self._pending.extend(batch)
+        self.flush()
+        return ids
+
+    def _find_near_duplicate(self, h: int) -> Optional[str]:
+        if not self._simhash_ids:
+            return None
+        dists = hamming_distances(self._simhashes[:len(self._simhash_ids)], h)
+        best = int(np.argmin(dists))
+        if dists[best] <= self.dedup_distance:
+            return str(self._simhash_ids[best])
+        return None
+
+    def _remember_simhash(self, h: Optional[int], entry: int) -> None:
+        if h is None:
+            return
+        n = len(self._simhash_ids)
+        if n == len(self._simhashes):
+            grown = np.zeros(max(1024, 2 * n), dtype=np.uint64)
+            grown[:n] = self._simhashes
+            self._simhashes = grown
+        self._simhashes[n] = h
+        self._simhash_ids.append(entry)
+
+    def _maybe_flush(self) -> None:
+        if (
+            len(self._pending) >= self.batch_size
+            or time.monotonic() - self._pending_since >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """Embed and index all queued segments.
+
+        In background mode this waits for the worker to drain the queue and
+        re-raises any error it hit.
+        """
+        if self._thread is not None:
+            if self._failed:
+                self._queue.put(None)  # wake the worker to retry
+            self._queue.join()
+            error, self._worker_error = self._worker_error, None
+            if error is not None:
+                raise error
+            return
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if pending or self._failed:
+                self._index_segments(pending)
+
+    def _index_segments(self, segments: List[Dict]) -> None:
+        """Index `segments` after any earlier failed ones, keeping them all on failure."""
+        with self._lock:
+            segments = self._failed + segments
+            self._failed = []
+        try:
+            texts = [seg.get("text") or "" for seg in segments]
+            if self.block_size:
+                with self._lock:
+                    self._add_blocks(texts)
+                    self._meta.extend(segments)
+                    self._fingerprint = _chain_fingerprint(self._fingerprint, segments)
+                    self._maybe_rescale()
+                return
+            vecs = self._embed_cached(texts)
+            with self._lock:
+                self._index.add(vecs)
+                self._meta.extend(segments)
+                self._fingerprint = _chain_fingerprint(self._fingerprint, segments)
+                self._maybe_rescale()
+        except BaseException:
+            with self._lock:
+                self._failed = segments + self._failed
+            raise
+
+    def _target_scale(self, n: int) -> str:
+        if self.scale == "auto":
+            if n < SCALE_LIMITS["small"]:
+                return "small"
+            if n < SCALE_LIMITS["medium"]:
+                return "medium"
+        elif self.scale != "large":
+            return self.scale
+        return "large" if n >= IVF_MIN_TRAIN else _index_scale(self._index)
+
+    def _maybe_rescale(self) -> None:
+        """Start rebuilding the index with the structure for its size at each doubling.
+
+        Called with `_lock` held. The new index is trained and filled on a
+        separate thread, so adds and queries keep using the current index
+        meanwhile. IVF-PQ stores lossy codes, so once an index is "large" it
+        is never rebuilt again.
+        """
+        n = self._index.ntotal
+        if not self._rescale_at or n < self._rescale_at or self._rescaler is not None:
+            return
+        while self._rescale_at <= n:
+            self._rescale_at *= 2
+        current = _index_scale(self._index)
+        target = self._target_scale(n)
+        if target == current or current == "large":
+            return
+        vecs = self._index.reconstruct_n(0, n)
+        self._rescaler = threading.Thread(
+            target=self._rescale, args=(target, vecs), name="rag-indexer-rescale", daemon=True
+        )
+        self._rescaler.start()
+
+    def _rescale(self, target: str, vecs: np.ndarray) -> None:
+        """Build a `target` index from `vecs` and swap it in, adding vectors indexed meanwhile."""
+        try:
+            n = len(vecs)
+            sample = None
+            if target == "large":
+                rng = np.random.default_rng(0)
+                size = min(n, IVF_TRAIN_PER_LIST * _ivf_nlist(n, n))
+                sample = vecs[rng.choice(n, size=size, replace=False)]
+            index = _make_scaled_index(self.dim, target, self.hnsw_m, self.precision, sample, n=n)
+            index.add(vecs)
+            with self._lock:
+                extra = self._index.ntotal - n
+                if extra:
+                    index.add(self._index.reconstruct_n(n, extra))
+                self._index = index
+        except Exception as e:
+            self._rescale_error = e
+        finally:
+            with self._lock:
+                self._rescaler = None
+
+    def _join_rescale(self) -> None:
+        """Wait for an in-flight rebuild and re-raise any error it hit."""
+        rescaler = self._rescaler
+        if rescaler is not None:
+            rescaler.join()
+        error, self._rescale_error = self._rescale_error, None
+        if error is not None:
+            raise error
+
+    def _worker(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            segments = [seg for seg in batch if isinstance(seg, dict)]
+            try:
+                if segments or self._failed:
+                    self._index_segments(segments)
+            except Exception as e:
+                self._worker_error = e
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if batch[-1] is _STOP:
+                return
+
+    def close(self) -> None:
+        """Index any queued segments, stop the background worker and wait for a rebuild.
+
+        Segments added after `close` are indexed synchronously.
+        """
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+            self._queue = None
+        self.flush()
+        self._join_rescale()
+
+    def _split_blocks(self, text: str) -> List[str]:
+        words = text.split()
+        return [
+            " ".join(words[i:i + self.block_size])
+            for i in range(0, len(words), self.block_size)
+        ] or [""]
 
-    def add_segment(self, segment: Dict) -> str:
-        """Add a segment to the index and return an entry id. (stub)
+    def _add_blocks(self, texts: List[str]) -> None:
+        new_blocks: Dict[str, str] = {}
+        links = []
+        for seg_idx, text in enumerate(texts, start=len(self._meta)):
+            for block in self._split_blocks(text):
+                key = EmbeddingCache.key(block)
+                if key not in self._block_ids:
+                    new_blocks.setdefault(key, block)
+                links.append((key, seg_idx))
+        if new_blocks:
+            # Embed before registering the blocks, so a failure leaves no trace.
+            self._index.add(self._embed_cached(list(new_blocks.values())))
+            for key in new_blocks:
+                self._block_ids[key] = len(self._block_ids)
+                self._block_segments.append([])
+        for key, seg_idx in links:
+            segs = self._block_segments[self._block_ids[key]]
+            if not segs or segs[-1] != seg_idx:
+                segs.append(seg_idx)
+
+    def _search(self, queries: np.ndarray, top_k: int) -> List[List[Tuple[int, float]]]:
+        """Return `(segment index, score)` hits per query row, best first."""
+        if not self.block_size:
+            scores, ids = self._index.search(queries, top_k)
+            return [
+                [(int(i), float(s)) for s, i in zip(row_s, row_i) if i >= 0]
+                for row_s, row_i in zip(scores, ids)
+            ]
+        n_blocks = len(self._block_segments)
+        hits = []
+        for q in queries:
+            k = min(4 * top_k, n_blocks)
+            while True:
+                scores, ids = self._index.search(q[None, :], k)
+                best: Dict[int, float] = {}
+                for s, i in zip(scores[0], ids[0]):
+                    if i < 0:
+                        continue
+                    for seg_idx in self._block_segments[i]:
+                        best.setdefault(seg_idx, float(s))
+                if len(best) >= top_k or k >= n_blocks:
+                    break
+                k = min(2 * k, n_blocks)
+            hits.append(sorted(best.items(), key=lambda kv: -kv[1])[:top_k])
+        return hits
+
+    def stats(self) -> Dict[str, int]:
+        """Return segment counts and embedding cache hit/miss counters."""
+        query_info = self._embed_query.cache_info()
+        return {
+            "segments": len(self),
+            "vectors": int(self._index.ntotal),
+            "cache_hits": self._cache.hits if self._cache else 0,
+            "cache_misses": self._cache.misses if self._cache else 0,
+            "query_cache_hits": query_info.hits,
+            "query_cache_misses": query_info.misses,
+            "dropped": self.dropped,
+        }
+
+    def fingerprint(self) -> str:
+        """Return a hash of every indexed segment, in order, after flushing.
+
+        Two indexers with the same fingerprint hold the same segments, so it
+        can key results cached across processes.
         """
-        raise NotImplementedError()
+        self.flush()
+        with self._lock:
+            return self._fingerprint
 
     def query(self, query_text: str, top_k: int = 5) -> List[Dict]:
-        """Return top_k matching segments with scores. (stub)
+        """Return top_k matching segments with scores."""
+        return self._query_unit(self._embed_query(" ".join(query_text.split())), top_k)[0]
+
+    def query_vec(self, vec: np.ndarray, top_k: int = 5) -> List[Dict]:
+        """Return top_k matching segments for an already-embedded query.
+
+        `vec` is L2-normalized here, so callers may pass raw embeddings.
         """
-        raise NotImplementedError()
+        return self.query_vecs(np.asarray(vec).reshape(1, self.dim), top_k=top_k)[0]
+
+    def query_batch(self, query_texts: List[str], top_k: int = 5) -> List[List[Dict]]:
+        """Return top_k matches for each query, using one embedder call and one search."""
+        if not query_texts:
+            return []
+        return self._query_unit(self._embed([" ".join(t.split()) for t in query_texts]), top_k)
+
+    def query_vecs(self, vecs: np.ndarray, top_k: int = 5) -> List[List[Dict]]:
+        """Batched `query_vec`: one result list per row of `vecs`."""
+        return self._query_unit(_normalize(np.array(vecs, dtype=np.float32).reshape(-1, self.dim)), top_k)
+
+    def _query_unit(self, vecs: np.ndarray, top_k: int) -> List[List[Dict]]:
+        """Search with rows of `vecs` that are already unit-length."""
+        self.flush()
+        with self._lock:
+            top_k = min(top_k, len(self._meta))
+            if top_k <= 0:
+                return [[] for _ in vecs]
+            return [
+                [dict(self._meta[i], score=s) for i, s in hits]
+                for hits in self._search(vecs, top_k)
+            ]
 
     def save(self) -> None:
-        """Persist index to disk. (stub)
-        """
-        raise NotImplementedError()
+        """Persist index to disk."""
+        if not self.index_path:
+            raise ValueError("Indexer has no index_path to save to")
+        self.flush()
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self) -> None:
+        os.makedirs(self.index_path, exist_ok=True)
+        if self.backend == "faiss":
+            path = self._index_file()
+            faiss.write_index(self._index, path + ".tmp")
+            os.replace(path + ".tmp", path)
+        else:
+            self._index.save(self._index_file())
+        self._meta.save(*self._meta_files())
+        _atomic_write(
+            os.path.join(self.index_path, FINGERPRINT_FILE),
+            lambda f: f.write(self._fingerprint.encode("ascii")),
+        )
+        if self._simhash_ids:
+            n = len(self._simhash_ids)
+            table = np.stack([self._simhashes[:n], np.asarray(self._simhash_ids, dtype=np.uint64)])
+            _atomic_write(os.path.join(self.index_path, SIMHASH_FILE), lambda f: np.save(f, table))
+        if self.block_size:
+            blocks = {
+                "block_size": self.block_size,
+                "keys": list(self._block_ids),
+                "segments": self._block_segments,
+            }
+            _atomic_write(
+                os.path.join(self.index_path, BLOCKS_FILE),
+                lambda f: f.write(json.dumps(blocks).encode("utf-8")),
+            )
 
     def load(self) -> None:
-        """Load index from disk. (stub)
-        """
-        raise NotImplementedError()
+        """Load index from disk, memory-mapping vectors and metadata."""
+        if not self.index_path:
+            raise ValueError("Indexer has no index_path to load from")
+        if self.backend == "faiss":
+            self._index = faiss.read_index(
+                self._index_file(), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+            )
+            if isinstance(self._index, faiss.IndexIVF):
+                # Mapped inverted lists are read-only and would reject the
+                # next add; IVF-PQ codes are compact enough to load in memory.
+                self._index = faiss.read_index(self._index_file())
+            if self.scale is not None:
+                self._rescale_at = 1 << max(10, int(self._index.ntotal).bit_length())
+        else:
+            self._index = FlatIndex.load(self._index_file(), use_mmap=True)
+        self._meta = JsonlMeta.load(*self._meta_files())
+        fingerprint_file = os.path.join(self.index_path, FINGERPRINT_FILE)
+        if os.path.exists(fingerprint_file):
+            with open(fingerprint_file, "r", encoding="ascii") as f:
+                self._fingerprint = f.read()
+        else:
+            self._fingerprint = _chain_fingerprint("", (self._meta[i] for i in range(len(self._meta))))
+        self._pending = []
+        self._failed = []
+        self._n_added = len(self._meta)
+        simhash_file = os.path.join(self.index_path, SIMHASH_FILE)
+        if os.path.exists(simhash_file):
+            hashes, entries = np.load(simhash_file)
+            self._simhashes = hashes.copy()
+            self._simhash_ids = [int(i) for i in entries]
+        blocks_file = os.path.join(self.index_path, BLOCKS_FILE)
+        if os.path.exists(blocks_file):
+            with open(blocks_file, "r", encoding="utf-8") as f:
+                blocks = json.load(f)
+            self.block_size = blocks["block_size"]
+            self._block_ids = {key: i for i, key in enumerate(blocks["keys"])}
+            self._block_segments = blocks["segments"]
+
+    def _meta_files(self):
+        return (
+            os.path.join(self.index_path, META_FILE),
+            os.path.join(self.index_path, META_OFFSETS_FILE),
+        )
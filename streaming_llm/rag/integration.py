@@ -4,16 +4,64 @@ This module exposes helpers to convert retrieved text into tokens or into a form
 that can be re-inserted into the model's attention (e.g., by prepending text,
 or by constructing fake past_key_values if supported).
 """
-from typing import List, Dict, Any
+import weakref
+from typing import List, Dict, Any, Union
 
+_SEP = "\n\n---\n\n"
 
-def convert_passages_to_inputs(passages: List[Dict]) -> str:
+# Separator token ids per tokenizer, so the separator is only encoded once.
+_sep_ids: "weakref.WeakKeyDictionary[Any, List[int]]" = weakref.WeakKeyDictionary()
+
+
+def convert_passages_to_inputs(
+    passages: List[Dict], tokenizer: Any = None, return_tensors: str = None
+) -> Union[str, List[int], Any]:
     """Turn ranked passages into a single text blob suitable for prepending.
 
     Simple default: concatenate top passages separated by separators.
+    Missing or None text is treated as an empty passage.
+
+    With a Hugging Face `tokenizer`, the passages are tokenized in one
+    batched call (without special tokens) and joined with the cached
+    separator ids instead, returning a flat list of token ids so the caller
+    does not re-tokenize the blob; `return_tensors="pt"` returns them as a
+    1-D `torch.LongTensor`.
     """
-    texts = [p.get("text", "") for p in passages]
-    return "\n\n---\n\n".join(texts)
+    if tokenizer is not None:
+        ids = _passages_to_ids(passages, tokenizer)
+        if return_tensors == "pt":
+            import torch
+
+            return torch.tensor(ids, dtype=torch.long)
+        return ids
+    if not passages:
+        return ""
+    if len(passages) == 1:
+        return passages[0].get("text") or ""
+    return _SEP.join(p.get("text") or "" for p in passages)
+
+
+def _passages_to_ids(passages: List[Dict], tokenizer: Any) -> List[int]:
+    if not passages:
+        return []
+    encoded = tokenizer([p.get("text") or "" for p in passages], add_special_tokens=False)["input_ids"]
+    sep = _separator_ids(tokenizer)
+    ids = list(encoded[0])
+    for passage_ids in encoded[1:]:
+        ids.extend(sep)
+        ids.extend(passage_ids)
+    return ids
+
+
+def _separator_ids(tokenizer: Any) -> List[int]:
+    try:
+        return _sep_ids[tokenizer]
+    except KeyError:
+        pass
+    except TypeError:  # tokenizer cannot be weakly referenced
+        return tokenizer.encode(_SEP, add_special_tokens=False)
+    sep = _sep_ids[tokenizer] = tokenizer.encode(_SEP, add_special_tokens=False)
+    return sep
 
 
 def reintegrate_passages(model: Any, tokenizer: Any, passages: List[Dict]) -> None:
@@ -1,18 +1,179 @@
-"""High-level retriever abstraction (skeleton).
+"""High-level retriever abstraction.
 
-This module should provide a simple `Retriever` class that wraps an `Indexer` and
-returns ranked passages for a query.
+`Retriever` wraps an `Indexer` and returns ranked passages for a query. With a
+`reranker`, retrieval runs in two stages: the indexer's cheap bi-encoder search
+recalls `top_k * overshoot` candidates, then a cross-encoder rescores only
+those candidates and the best `top_k` are returned.
+
+Passing `rewrites` enables multi-query retrieval (RAG-Fusion): the query and
+its rewordings are embedded in one batch, searched in one batched index call,
+and the ranked lists are merged with reciprocal rank fusion. Independent
+queries can likewise be answered together with `retrieve_batch`.
+
+Results are memoized in an LRU cache keyed by the query, `top_k`, the
+rewrites and the indexer's size, so a repeated query skips the search while
+any segment added to the indexer invalidates stale entries automatically.
+Indexers without a size (no `__len__`) are never cached. With `cache_path`,
+results are also written through to a `dbm` file under SHA-256 keys that
+include the indexer's content `fingerprint()`, so a repeated query set (e.g.
+an eval harness) is served from disk after a restart without touching the
+indexer, while a different index of the same size never sees its entries.
+Indexers without a `fingerprint` are not cached on disk.
 """
-from typing import List, Dict
+import copy
+import dbm
+import functools
+import hashlib
+import pickle
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+try:
+    import lz4.frame
+except ImportError:  # pragma: no cover - optional dependency
+    lz4 = None
+
+from .embedder import load_reranker
+
+RRF_K = 60  # standard reciprocal rank fusion damping constant
 
 
 class Retriever:
-    def __init__(self, indexer):
-        """Create a retriever over the given `indexer` (stub).
+    def __init__(
+        self,
+        indexer,
+        reranker=None,
+        overshoot: int = 10,
+        rerank_batch_size: int = 32,
+        cache_size: int = 512,
+        cache_path: Optional[str] = None,
+        default_top_k: int = 5,
+    ):
+        """Create a retriever over the given `indexer`.
+
+        `reranker` may be an object with a CrossEncoder-like
+        `predict(pairs, batch_size=...)` method or a sentence-transformers
+        cross-encoder model name. Up to `cache_size` results are memoized
+        (0 disables the cache), and persisted to the dbm file `cache_path`
+        when given. The persistent cache is not keyed by the reranker, so
+        use one `cache_path` per retrieval configuration. `default_top_k` is
+        used by `retrieve` calls that do not pass `top_k`.
         """
         self.indexer = indexer
+        self.default_top_k = default_top_k
+        self.reranker = load_reranker(reranker)
+        self.overshoot = overshoot
+        self.rerank_batch_size = rerank_batch_size
+        self._dbm = dbm.open(cache_path, "c") if cache_path else None
+        self._cached = None
+        if cache_size:
+            self._cached = functools.lru_cache(maxsize=cache_size)(self._retrieve_cached)
+        elif self._dbm is not None:
+            self._cached = self._retrieve_cached
+
+    def retrieve(
+        self, query_text: str, top_k: Optional[int] = None, rewrites: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """Return top_k candidate passages for `query_text` with scores.
 
-    def retrieve(self, query_text: str, top_k: int = 5) -> List[Dict]:
-        """Return top_k candidate passages for `query_text` with scores. (stub)
+        `top_k` defaults to `default_top_k`. `rewrites` are alternative
+        phrasings of the query whose results are fused with the original's by
+        reciprocal rank fusion.
         """
-        return self.indexer.query(query_text, top_k=top_k)
+        if top_k is None:
+            top_k = self.default_top_k
+        if self._cached is None and self.reranker is None and not rewrites:
+            return self.indexer.query(query_text, top_k=top_k)
+        if self._cached is not None:
+            try:
+                version = len(self.indexer)
+            except TypeError:
+                version = None
+            if version is not None:
+                hits = self._cached(query_text, top_k, tuple(rewrites or ()), version)
+                # Deep copies, so callers mutating nested `meta` can't corrupt the cache.
+                return copy.deepcopy(list(hits))
+        return self._retrieve(query_text, top_k, rewrites)
+
+    def retrieve_batch(self, queries: List[str], top_k: Optional[int] = None) -> List[List[Dict]]:
+        """Return the `retrieve` results for each of `queries`.
+
+        Without a reranker, indexers exposing `query_batch` answer all the
+        queries in one embedding call and one index search; the result cache
+        is bypassed. Other configurations fall back to one `retrieve` per query.
+        """
+        if top_k is None:
+            top_k = self.default_top_k
+        if self.reranker is None and hasattr(self.indexer, "query_batch"):
+            return self.indexer.query_batch(list(queries), top_k=top_k)
+        return [self.retrieve(q, top_k=top_k) for q in queries]
+
+    def invalidate(self) -> None:
+        """Drop all memoized results, in memory and on disk."""
+        if hasattr(self._cached, "cache_clear"):
+            self._cached.cache_clear()
+        if self._dbm is not None:
+            for key in list(self._dbm.keys()):
+                del self._dbm[key]
+
+    def close(self) -> None:
+        """Close the persistent cache, if any."""
+        if self._dbm is not None:
+            self._dbm.close()
+            self._dbm = None
+            if not hasattr(self._cached, "cache_clear"):
+                self._cached = None
+
+    def _retrieve_cached(
+        self, query_text: str, top_k: int, rewrites: Tuple[str, ...], version: int
+    ) -> Tuple[Dict, ...]:
+        # `version` only keys the cache, so results are recomputed after adds.
+        fingerprint = getattr(self.indexer, "fingerprint", None)
+        if self._dbm is None or fingerprint is None:
+            return tuple(self._retrieve(query_text, top_k, list(rewrites)))
+        key = hashlib.sha256(pickle.dumps((query_text, top_k, rewrites, fingerprint()))).digest()
+        raw = self._dbm.get(key)
+        if raw is not None and (raw[:1] == b"\x00" or lz4 is not None):
+            data = raw[1:] if raw[:1] == b"\x00" else lz4.frame.decompress(raw[1:])
+            return tuple(pickle.loads(data))
+        hits = self._retrieve(query_text, top_k, list(rewrites))
+        data = pickle.dumps(hits)
+        # Tag byte: 0x01 for an LZ4 frame, 0x00 for a plain pickle.
+        self._dbm[key] = b"\x01" + lz4.frame.compress(data) if lz4 is not None else b"\x00" + data
+        return tuple(hits)
+
+    def _retrieve(self, query_text: str, top_k: int, rewrites: Optional[List[str]]) -> List[Dict]:
+        if self.reranker is None:
+            if rewrites:
+                return self._fused(query_text, rewrites, top_k, depth=top_k * self.overshoot)
+            return self.indexer.query(query_text, top_k=top_k)
+        if rewrites:
+            candidates = self._fused(query_text, rewrites, top_k * self.overshoot, depth=top_k * self.overshoot)
+        else:
+            candidates = self.indexer.query(query_text, top_k=top_k * self.overshoot)
+        if not candidates or top_k <= 0:
+            return []
+        scores = np.asarray(self.reranker.predict(
+            [(query_text, c.get("text") or "") for c in candidates],
+            batch_size=self.rerank_batch_size,
+        ), dtype=np.float32).reshape(-1)
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        return [
+            dict(candidates[i], score=float(scores[i]), retrieval_score=candidates[i].get("score"))
+            for i in order
+        ]
+
+    def _fused(self, query_text: str, rewrites: List[str], top_k: int, depth: int) -> List[Dict]:
+        """Reciprocal-rank-fuse the top `depth` results of the query and its rewrites."""
+        if top_k <= 0:
+            return []
+        ranked = self.indexer.query_batch([query_text, *rewrites], top_k=depth)
+        fused: Dict = {}
+        for results in ranked:
+            for rank, passage in enumerate(results):
+                key = passage.get("id", passage.get("text"))
+                best, score = fused.get(key, (passage, 0.0))
+                fused[key] = (best, score + 1.0 / (RRF_K + rank + 1))
+        top = sorted(fused.values(), key=lambda item: -item[1])[:top_k]
+        return [dict(p, score=score, retrieval_score=p.get("score")) for p, score in top]
@@ -1,10 +1,89 @@
-"""Evicted segments persistent store (skeleton).
+"""Evicted segments persistent store.
 
-This module provides a simple API to persist and retrieve evicted text segments.
-Implementations can back this by files, sqlite, or an object store.
+Segments are appended to a single SQLite database (`segments.db`) in WAL mode
+(`synchronous` set by the `durability` option): one row per segment keyed by its integer id, with
+every field besides the text serialized together in a `fields` column so
+nothing a caller attaches to a segment is lost. Fields are JSON, encoded with
+`orjson` when it is installed (several times faster than `json` and able to
+serialize numpy values). Writes are buffered and committed in one transaction
+once `batch_size` segments or `flush_bytes` bytes are pending, or when an add
+finds the oldest pending segment `flush_interval` seconds old, so an
+eviction-heavy phase costs one group commit per batch instead of one file
+write per segment. The age is only checked on the next add (there is no
+timer), so call `flush` after a lone segment that must survive a hard kill.
+`add_segments` commits a caller's batch in a single transaction directly.
+
+The newest `recent_size` segments are also kept in memory (warm-started from
+the database on open), so `list_segments` with a limit within that window is
+answered without touching the database or flushing the write buffer.
+
+Rows are immutable once written, so `get_segment` keeps an LRU cache of
+decoded rows and reads through one connection (and one Zstd decompressor)
+per thread, letting retrieval threads look segments up concurrently with
+the writer. Ids are consecutive, so a segment still in the write buffer is
+found by its offset from the first buffered id rather than by forcing a
+commit.
+
+Reads go through a memory-mapped view of the database file (`mmap_size`), and
+ids are the table's rowid, so `get_segment` is a single B-tree lookup and
+`list_segments(limit)` walks only the last `limit` rows of the rowid index
+instead of scanning from the start of the file.
+
+When `zstandard` is installed, segment text is stored Zstd-compressed. Once
+`dict_samples` segments have been seen, a dictionary is trained on them and
+saved as `zstd.dict`; later segments are compressed against it, which
+typically shrinks short English segments several-fold. Every stored text
+starts with a one-byte codec tag, so rows written before the dictionary
+existed (or without compression) stay readable. Without zstandard, texts over
+`LZ4_MIN_SIZE` bytes are LZ4-compressed instead when `lz4` is installed.
+Unless `compression` is None, serialized fields over the same threshold are
+LZ4-compressed too (when `lz4` is installed).
 """
+from collections import deque
+from itertools import islice
 from typing import List, Dict, Optional
+import atexit
+import functools
+import json
 import os
+import pathlib
+import sqlite3
+import threading
+import time
+import weakref
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import lz4.frame
+except ImportError:  # pragma: no cover - optional dependency
+    lz4 = None
+
+try:
+    import zstandard as zstd
+except ImportError:  # pragma: no cover - optional dependency
+    zstd = None
+
+DB_FILE = "segments.db"
+DICT_FILE = "zstd.dict"
+MMAP_SIZE = 256 * 1024 * 1024
+ZSTD_LEVEL = 3
+DICT_SIZE = 100_000
+
+CODEC_RAW = 0
+CODEC_ZSTD = 1
+CODEC_ZSTD_DICT = 2
+CODEC_LZ4 = 3
+# Payloads below this size are not worth an LZ4 frame.
+LZ4_MIN_SIZE = 1024
+
+# durability -> SQLite `synchronous` level. "full" syncs every commit,
+# "normal" only at WAL checkpoints (a crash may lose the last commits, never
+# corrupt the file), "relaxed" never syncs until `close`.
+DURABILITY = {"full": "FULL", "normal": "NORMAL", "relaxed": "OFF"}
 
 
 class EvictedStore:
@@ -16,24 +95,320 @@ class EvictedStore:
       - "meta": optional metadata (timestamps, token ranges)
     """
 
-    def __init__(self, path: str):
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = 64,
+        flush_bytes: int = 64 << 10,
+        flush_interval: float = 0.005,
+        recent_size: int = 1024,
+        cache_size: int = 4096,
+        mmap_size: int = MMAP_SIZE,
+        compression: Optional[str] = "auto",
+        dict_samples: int = 1000,
+        durability: str = "normal",
+    ):
         """Create a store rooted at `path`.
+
+        Added segments are buffered until `batch_size` segments or
+        `flush_bytes` encoded bytes are pending, or until an add finds the
+        oldest pending one `flush_interval` seconds old; reads always see
+        every added segment, and the buffer is also flushed on `close` and
+        at interpreter exit.
+        The newest `recent_size` segments are cached for `list_segments` and
+        up to `cache_size` decoded segments for `get_segment`.
+        Up to `mmap_size` bytes of the database are read through mmap (0
+        disables it). `compression` is "zstd", "lz4", None, or "auto" (the
+        first of zstd and lz4 that is installed); a shared zstd dictionary is trained after `dict_samples`
+        segments (0 disables training). `durability` is one of `DURABILITY`;
+        "relaxed" skips fsync entirely and syncs once on `close`.
         """
+        if durability not in DURABILITY:
+            raise ValueError(f"Unknown durability: {durability}")
+        if compression == "auto":
+            compression = "zstd" if zstd is not None else "lz4" if lz4 is not None else None
+        if compression not in ("zstd", "lz4", None):
+            raise ValueError(f"Unknown compression: {compression}")
+        if compression == "zstd" and zstd is None:
+            raise ImportError("zstandard is required for zstd compression: pip install zstandard")
+        if compression == "lz4" and lz4 is None:
+            raise ImportError("lz4 is required for lz4 compression: pip install lz4")
         self.path = path
         os.makedirs(self.path, exist_ok=True)
+        self.batch_size = batch_size
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.mmap_size = int(mmap_size)
+        self.durability = durability
+        self.db = sqlite3.connect(
+            os.path.join(self.path, DB_FILE), isolation_level=None, check_same_thread=False
+        )
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(f"PRAGMA synchronous={DURABILITY[durability]}")
+        self.db.execute(f"PRAGMA mmap_size={self.mmap_size}")
+        self._write_lock = threading.RLock()
+        self._owner = threading.get_ident()
+        self._tls = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._get_row = functools.lru_cache(maxsize=cache_size)(self._read_row)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS segments "
+            "(id INTEGER PRIMARY KEY, text BLOB, fields BLOB)"
+        )
+        (last_id,) = self.db.execute("SELECT MAX(id) FROM segments").fetchone()
+        self._next_id = (last_id or 0) + 1
+        self._pending: List[tuple] = []
+        self._pending_bytes = 0
+        self._pending_since = 0.0
+        self.compression = compression
+        self.dict_samples = dict_samples
+        self._samples: List[bytes] = []
+        self._dict = None
+        self._cctx = None
+        # The dictionary is loaded whatever `compression` is, since rows tagged
+        # CODEC_ZSTD_DICT need it to decode; only "zstd" compresses with it.
+        dict_path = os.path.join(self.path, DICT_FILE)
+        if zstd is not None and os.path.exists(dict_path):
+            with open(dict_path, "rb") as f:
+                self._dict = zstd.ZstdCompressionDict(f.read())
+        if compression == "zstd":
+            self._cctx = zstd.ZstdCompressor(level=ZSTD_LEVEL, dict_data=self._dict)
+        # (id, text, encoded fields) of the newest segments, newest first.
+        self._recent: deque = deque(maxlen=recent_size)
+        if recent_size:
+            rows = self.db.execute(
+                "SELECT id, text, fields FROM segments ORDER BY id DESC LIMIT ?", (recent_size,)
+            )
+            self._recent.extend((seg_id, self._decode_text(text), fields) for seg_id, text, fields in rows)
+        # A per-store callable, so `close` unregisters only this store's hook.
+        self._atexit = functools.partial(_flush_at_exit, weakref.ref(self))
+        atexit.register(self._atexit)
 
     def add_segment(self, segment: Dict) -> str:
-        """Persist a new segment and return its id. (stub)
+        """Persist a new segment and return its id."""
+        seg_id = self._buffer(segment)
+        self._maybe_flush()
+        return seg_id
+
+    def add_segments(self, segments: List[Dict]) -> List[str]:
+        """Persist a batch of segments in one transaction and return their ids."""
+        with self._write_lock:
+            ids = [self._buffer(segment) for segment in segments]
+            self.flush()
+        return ids
+
+    def _buffer(self, segment: Dict) -> str:
+        fields = {k: v for k, v in segment.items() if k not in ("id", "text")}
+        fields.setdefault("meta", {})
+        text = segment.get("text") or ""
+        with self._write_lock:
+            seg_id = self._next_id
+            self._next_id += 1
+            row = (seg_id, self._encode_text(text), _dumps(fields, self.compression is not None))
+            if self._recent.maxlen:
+                self._recent.appendleft((seg_id, text, row[2]))
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            self._pending.append(row)
+            self._pending_bytes += len(row[1]) + len(row[2])
+        return str(seg_id)
+
+    def _maybe_flush(self) -> None:
+        if (
+            len(self._pending) >= self.batch_size
+            or self._pending_bytes >= self.flush_bytes
+            or time.monotonic() - self._pending_since >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """Write buffered segments in a single transaction."""
+        with self._write_lock:
+            if not self._pending:
+                return
+            self.db.execute("BEGIN")
+            try:
+                self.db.executemany(
+                    "INSERT INTO segments (id, text, fields) VALUES (?, ?, ?)", self._pending
+                )
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+            self._pending = []
+            self._pending_bytes = 0
+
+    def _encode_text(self, text: str) -> bytes:
+        data = text.encode("utf-8")
+        if self.compression == "lz4" and len(data) > LZ4_MIN_SIZE:
+            return bytes([CODEC_LZ4]) + lz4.frame.compress(data)
+        if self._cctx is None:
+            return bytes([CODEC_RAW]) + data
+        if self._dict is None and self.dict_samples:
+            self._samples.append(data)
+            if len(self._samples) >= self.dict_samples:
+                self._train_dict()
+        codec = CODEC_ZSTD_DICT if self._dict is not None else CODEC_ZSTD
+        return bytes([codec]) + self._cctx.compress(data)
+
+    def _train_dict(self) -> None:
+        """Train the shared dictionary on the collected samples and persist it.
+
+        The dictionary is written once and never replaced, since rows tagged
+        `CODEC_ZSTD_DICT` can only be decoded with it.
         """
-        # TODO: implement persistence
-        raise NotImplementedError()
+        samples, self._samples = self._samples, []
+        self.dict_samples = 0
+        try:
+            dict_data = zstd.train_dictionary(DICT_SIZE, samples)
+        except zstd.ZstdError:
+            return  # too little data to train on; keep plain zstd
+        tmp = os.path.join(self.path, DICT_FILE + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(dict_data.as_bytes())
+        os.replace(tmp, os.path.join(self.path, DICT_FILE))
+        self._dict = dict_data
+        self._cctx = zstd.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dict_data)
+
+    def _decode_text(self, blob: bytes) -> str:
+        # Slice through a memoryview so the payload is not copied before decoding.
+        codec, data = blob[0], memoryview(blob)[1:]
+        if codec == CODEC_LZ4:
+            if lz4 is None:
+                raise ImportError("lz4 is required to read compressed segments: pip install lz4")
+            data = lz4.frame.decompress(data)
+        elif codec != CODEC_RAW:
+            if zstd is None:
+                raise ImportError("zstandard is required to read compressed segments: pip install zstandard")
+            data = self._decompressor().decompress(data)
+        return str(data, "utf-8")
+
+    def _decompressor(self):
+        # Decompressors are not thread-safe; keep one per thread and rebuild
+        # it once a dictionary has been trained.
+        tls = self._tls
+        if getattr(tls, "dctx_dict", False) is not self._dict:
+            tls.dctx = zstd.ZstdDecompressor(dict_data=self._dict) if self._dict else zstd.ZstdDecompressor()
+            tls.dctx_dict = self._dict
+        return tls.dctx
+
+    def _reader(self) -> sqlite3.Connection:
+        """Return this thread's read connection (the write connection on the owning thread)."""
+        if threading.get_ident() == self._owner:
+            return self.db
+        conn = getattr(self._tls, "db", None)
+        if conn is None:
+            # as_uri() percent-encodes the path, so "#" or "?" in it survive.
+            uri = pathlib.Path(self.path, DB_FILE).resolve().as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            conn.execute(f"PRAGMA mmap_size={self.mmap_size}")
+            self._tls.db = conn
+            with self._write_lock:
+                self._readers.append(conn)
+        return conn
+
+    def _read_row(self, key: int) -> Optional[tuple]:
+        row = self._reader().execute(
+            "SELECT id, text, fields FROM segments WHERE id = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        seg_id, text, fields = row
+        # Cache the fields decompressed so a repeated get only parses JSON.
+        return seg_id, self._decode_text(text), _inflate(fields)
+
+    def _row_to_segment(self, row) -> Dict:
+        seg_id, text, fields = row
+        return {"id": str(seg_id), "text": self._decode_text(text), **_loads(fields)}
 
     def get_segment(self, segment_id: str) -> Optional[Dict]:
-        """Load a segment by id. (stub)
-        """
-        raise NotImplementedError()
+        """Load a segment by id, or None if it does not exist."""
+        try:
+            key = int(segment_id)
+        except (TypeError, ValueError):
+            return None
+        with self._write_lock:
+            if not 0 < key < self._next_id:
+                return None  # never cache a miss for an id that may be added later
+            pending = self._pending
+            first = pending[0][0] if pending else self._next_id
+        if key >= first:
+            # Still buffered: ids are consecutive, so the row is found by offset.
+            seg_id, text, fields = pending[key - first]
+            return {"id": str(seg_id), "text": self._decode_text(text), **_loads(fields)}
+        row = self._get_row(key)
+        if row is None:
+            return None
+        seg_id, text, fields = row
+        return {"id": str(seg_id), "text": text, **_loads(fields)}
 
     def list_segments(self, limit: int = 100) -> List[Dict]:
-        """List latest segments (stub).
-        """
-        raise NotImplementedError()
+        """List the latest `limit` segments, newest first."""
+        with self._write_lock:
+            # Snapshot under the lock: writers appendleft to the same deque.
+            cached = len(self._recent)
+            recent = None
+            if limit >= 0 and (limit <= cached or cached < self._recent.maxlen):
+                # The cache holds at least `limit` segments, or every segment.
+                recent = list(islice(self._recent, limit))
+        if recent is not None:
+            return [{"id": str(seg_id), "text": text, **_loads(fields)} for seg_id, text, fields in recent]
+        self.flush()
+        rows = self.db.execute(
+            "SELECT id, text, fields FROM segments ORDER BY id DESC LIMIT ?", (limit,)
+        )
+        return [self._row_to_segment(row) for row in rows]
+
+    def close(self) -> None:
+        """Flush pending segments and close the database."""
+        if self.db is not None:
+            self.flush()
+            for conn in self._readers:
+                conn.close()
+            self._readers = []
+            self._get_row.cache_clear()
+            if self.durability == "relaxed":
+                # Checkpoint with syncing on so the data reaches disk once.
+                self.db.execute("PRAGMA synchronous=FULL")
+                self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.db.close()
+            self.db = None
+            atexit.unregister(self._atexit)
+
+    def __enter__(self) -> "EvictedStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _flush_at_exit(ref: "weakref.ref[EvictedStore]") -> None:
+    store = ref()
+    if store is not None and store.db is not None:
+        store.flush()
+
+
+def _dumps(obj, compress: bool = True) -> bytes:
+    """Serialize `obj`, LZ4-compressing large payloads when `compress` is set."""
+    if orjson is not None:
+        data = orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    else:
+        data = json.dumps(obj).encode("utf-8")
+    if compress and lz4 is not None and len(data) > LZ4_MIN_SIZE:
+        # Serialized JSON objects start with "{", so the tag byte is unambiguous.
+        return bytes([CODEC_LZ4]) + lz4.frame.compress(data)
+    return data
+
+
+def _inflate(data: bytes) -> bytes:
+    """Return serialized fields with any LZ4 frame removed."""
+    if data[0] == CODEC_LZ4:
+        if lz4 is None:
+            raise ImportError("lz4 is required to read compressed segments: pip install lz4")
+        return lz4.frame.decompress(memoryview(data)[1:])
+    return data
+
+
+def _loads(data: bytes):
+    data = _inflate(data)
+    return orjson.loads(data) if orjson is not None else json.loads(data)
@@ -2,19 +2,108 @@
 
 Provide lightweight heuristics or a pluggable policy to decide when retrieval
 should be invoked during streaming generation.
+
+The first heuristic is a keyword prefilter: the phrases listed under
+`config["patterns"]` ("according to", question marks, ...) are compiled once
+into a single Hyperscan database (or one RE2 alternation when Hyperscan is not
+installed) and the tail of the recent generation text is scanned in one pass,
+so the check stays linear in the buffer size whatever the number of phrases.
 """
-from typing import Any, Dict
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import hyperscan
+except ImportError:  # pragma: no cover - optional dependency
+    hyperscan = None
+
+try:
+    import re2
+except ImportError:  # pragma: no cover - optional dependency
+    re2 = None
+
+KEYWORD_ENGINES = ("auto", "hyperscan", "re2")
+
+
+def compile_keywords(patterns: List[str], engine: str = "auto") -> Callable[[str], bool]:
+    """Compile `patterns` into a case-insensitive `matches(text) -> bool` scanner.
+
+    `engine` is "hyperscan", "re2" or "auto" (Hyperscan when installed, else
+    RE2). Neither backtracks, so scan time is linear in the text length.
+    """
+    if engine not in KEYWORD_ENGINES:
+        raise ValueError(f"Unknown keyword engine: {engine}")
+    if engine == "auto":
+        engine = "hyperscan" if hyperscan is not None else "re2"
+    if engine == "hyperscan":
+        if hyperscan is None:
+            raise ImportError("hyperscan is required for the hyperscan keyword engine: pip install hyperscan")
+        return _compile_hyperscan(patterns)
+    if re2 is None:
+        raise ImportError("hyperscan or re2 is required for keyword triggers: pip install google-re2")
+    regex = re2.compile("(?i)" + "|".join(f"(?:{p})" for p in patterns))
+    return lambda text: regex.search(text) is not None
+
+
+def _compile_hyperscan(patterns: List[str]) -> Callable[[str], bool]:
+    db = hyperscan.Database()
+    flags = hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH
+    db.compile(
+        expressions=[p.encode("utf-8") for p in patterns],
+        ids=list(range(len(patterns))),
+        elements=len(patterns),
+        flags=[flags] * len(patterns),
+    )
+
+    def on_match(*args) -> bool:
+        return True  # stop at the first match
+
+    def matches(text: str) -> bool:
+        try:
+            db.scan(text.encode("utf-8"), match_event_handler=on_match)
+        except hyperscan.ScanTerminated:
+            return True
+        return False
+
+    return matches
 
 
 class RetrievalTrigger:
     def __init__(self, config: Dict = None):
-        self.config = config or {}
+        """Create a trigger from `config` (kept by reference when given).
+
+        Recognized keys: `patterns` (trigger phrases, as regular expressions),
+        `keyword_engine` (see `compile_keywords`) and `scan_window` (number of
+        trailing characters of the recent text to scan, default 1024).
+        """
+        self.config = {} if config is None else config
+        patterns = self.config.get("patterns")
+        self.scan_window = self.config.get("scan_window", 1024)
+        self._matches: Optional[Callable[[str], bool]] = None
+        if patterns:
+            self._matches = compile_keywords(
+                list(patterns), self.config.get("keyword_engine", "auto")
+            )
 
     def should_trigger(self, context: Any) -> bool:
         """Return True when retrieval should be triggered based on `context`.
 
         `context` is opaque here (could be model state, recent tokens, or a query).
-        Implementations should inspect it and decide.
+        With keyword patterns configured, the text under `recent_text` (mapping
+        key or attribute) is scanned for any of them; otherwise retrieval is
+        never triggered.
         """
-        # stub implementation: never trigger
-        return False
+        if self._matches is None:
+            return False
+        text = _recent_text(context)
+        if not text:
+            return False
+        return self._matches(text[-self.scan_window:] if self.scan_window else text)
+
+
+def _recent_text(context: Any) -> Optional[str]:
+    if isinstance(context, Mapping):
+        text = context.get("recent_text")
+    else:
+        text = getattr(context, "recent_text", None)
+    return text if isinstance(text, str) else None
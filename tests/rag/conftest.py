@@ -0,0 +1,32 @@
+"""Shared fixtures for the RAG unit tests."""
+import pytest
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "stub: asserts placeholder behavior; deselect with -m 'not stub' once implemented"
+    )
+
+
+class FakeIndexer:
+    """Minimal indexer double recording `query` calls.
+
+    Much cheaper per call than `unittest.mock.Mock`, which matters in the
+    parametrized retriever tests.
+    """
+
+    __slots__ = ("ret", "calls")
+
+    def __init__(self):
+        self.ret = []
+        self.calls = []
+
+    def query(self, q, top_k=5):
+        self.calls.append((q, top_k))
+        return self.ret
+
+
+@pytest.fixture
+def fake_indexer():
+    """Provide a fresh FakeIndexer returning no results by default."""
+    return FakeIndexer()
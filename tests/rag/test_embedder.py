@@ -0,0 +1,146 @@
+"""Unit tests for the built-in text embedders."""
+import os
+import sys
+import tempfile
+import types
+
+import numpy as np
+import pytest
+from streaming_llm.rag.embedder import (
+    EmbeddingCache, HashingEmbedder, embedder_id, hamming_distances, load_embedder, simhash,
+)
+
+
+class TestHashingEmbedder:
+    """Test the dependency-free hashing embedder."""
+
+    def test_encode_shape_and_dtype(self):
+        """encode returns a float32 array of shape (n, dim)."""
+        emb = HashingEmbedder(dim=64)
+        vecs = emb.encode(["hello world", "foo"])
+        assert vecs.shape == (2, 64)
+        assert vecs.dtype == np.float32
+
+    def test_encode_single_string(self):
+        """A single string is encoded as a batch of one."""
+        emb = HashingEmbedder(dim=32)
+        assert emb.encode("hello").shape == (1, 32)
+
+    def test_encode_is_deterministic(self):
+        """The same text always maps to the same vector."""
+        emb = HashingEmbedder(dim=128)
+        assert np.array_equal(emb.encode(["same text"]), emb.encode(["same text"]))
+
+    def test_normalized_vectors_have_unit_norm(self):
+        """normalize_embeddings yields unit-length vectors."""
+        emb = HashingEmbedder(dim=128)
+        vecs = emb.encode(["some words here", "other words"], normalize_embeddings=True)
+        assert np.allclose(np.linalg.norm(vecs, axis=1), 1.0)
+
+    def test_empty_text_is_zero_vector(self):
+        """Empty or None text encodes to a zero vector."""
+        emb = HashingEmbedder(dim=16)
+        vecs = emb.encode(["", None], normalize_embeddings=True)
+        assert not vecs.any()
+
+
+class TestLoadEmbedder:
+    """Test embedder resolution."""
+
+    def test_none_gives_hashing_embedder(self):
+        """None resolves to a HashingEmbedder of the requested size."""
+        emb = load_embedder(None, dim=48)
+        assert isinstance(emb, HashingEmbedder)
+        assert emb.get_sentence_embedding_dimension() == 48
+
+    def test_object_passthrough(self):
+        """Objects are returned unchanged."""
+        emb = HashingEmbedder()
+        assert load_embedder(emb) is emb
+
+    def test_model_name_becomes_cache_id(self, monkeypatch):
+        """Models loaded by name are told apart by name, not by dimension."""
+        class SentenceTransformer:
+            def __init__(self, name):
+                pass
+
+            def get_sentence_embedding_dimension(self):
+                return 384
+
+        module = types.ModuleType("sentence_transformers")
+        module.SentenceTransformer = SentenceTransformer
+        monkeypatch.setitem(sys.modules, "sentence_transformers", module)
+        ids = {embedder_id(load_embedder(name)) for name in ("all-MiniLM-L6-v2", "bge-small-en")}
+        assert ids == {"all-MiniLM-L6-v2", "bge-small-en"}
+
+
+class TestEmbeddingCache:
+    """Test the content-hash embedding cache."""
+
+    @pytest.mark.parametrize("on_disk", [False, True])
+    def test_put_then_get(self, on_disk):
+        """Stored vectors are returned for their key."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cache.db") if on_disk else None
+            cache = EmbeddingCache(path, model_id="m")
+            key = EmbeddingCache.key("hello")
+            cache.put_many([(key, np.ones(4, dtype=np.float32))])
+            found = cache.get_many([key, EmbeddingCache.key("other")])
+            cache.close()
+        assert list(found) == [key]
+        assert np.array_equal(found[key], np.ones(4, dtype=np.float32))
+
+    def test_hit_and_miss_counters(self):
+        """get_many counts hits and misses."""
+        cache = EmbeddingCache()
+        key = EmbeddingCache.key("a")
+        cache.put_many([(key, np.zeros(2))])
+        cache.get_many([key, EmbeddingCache.key("b")])
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_memory_cache_is_bounded(self):
+        """Without a path, the least recently used vectors are evicted."""
+        cache = EmbeddingCache(max_entries=2)
+        a, b, c = (EmbeddingCache.key(t) for t in "abc")
+        cache.put_many([(a, np.zeros(2)), (b, np.zeros(2))])
+        cache.get_many([a])
+        cache.put_many([(c, np.zeros(2))])
+        assert set(cache.get_many([a, b, c])) == {a, c}
+
+    def test_key_normalizes_whitespace(self):
+        """Keys ignore leading, trailing and repeated whitespace."""
+        assert EmbeddingCache.key("  a   b ") == EmbeddingCache.key("a b")
+
+    def test_disk_cache_is_namespaced_by_model(self):
+        """Entries written for one model are not visible to another."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cache.db")
+            key = EmbeddingCache.key("text")
+            EmbeddingCache(path, model_id="a").put_many([(key, np.ones(2))])
+            assert EmbeddingCache(path, model_id="a").get_many([key])
+            assert not EmbeddingCache(path, model_id="b").get_many([key])
+
+
+class TestSimHash:
+    """Test SimHash fingerprints and Hamming distances."""
+
+    def test_simhash_is_stable_64_bit(self):
+        """simhash returns the same 64-bit value across calls and normalizes case."""
+        h = simhash("The quick brown fox")
+        assert h == simhash("the QUICK brown fox")
+        assert 0 <= h < 2 ** 64
+
+    def test_small_edit_is_close(self):
+        """One edited word in a long text flips only a few bits; unrelated text flips many."""
+        words = [f"w{i * 13 % 997}" for i in range(300)]
+        base = simhash(" ".join(words))
+        words[150] = "changed"
+        edited = simhash(" ".join(words))
+        other = simhash(" ".join(f"x{i}" for i in range(300)))
+        dists = hamming_distances(np.array([edited, other], dtype=np.uint64), base)
+        assert dists[0] <= 4 < dists[1]
+
+    def test_hamming_distances(self):
+        """hamming_distances counts differing bits per entry."""
+        hashes = np.array([0, 1, 0b1011, 2 ** 64 - 1], dtype=np.uint64)
+        assert hamming_distances(hashes, 0).tolist() == [0, 1, 3, 64]
@@ -7,7 +7,42 @@ Tests are implementation-agnostic and focus on behavior contracts.
 import pytest
 import tempfile
 import os
-from streaming_llm.rag.indexer import Indexer
+import threading
+from types import MappingProxyType
+import numpy as np
+from streaming_llm.rag import indexer as indexer_module
+from streaming_llm.rag.embedder import HashingEmbedder
+from streaming_llm.rag.indexer import FlatIndex, Indexer, JsonlMeta, faiss
+
+BACKENDS = [
+    "numpy",
+    pytest.param("faiss", marks=pytest.mark.skipif(faiss is None, reason="faiss not installed")),
+]
+
+
+class CountingEmbedder(HashingEmbedder):
+    """Hashing embedder that records the size of each encode call."""
+
+    def __init__(self, dim=64):
+        super().__init__(dim=dim)
+        self.calls = []
+
+    def encode(self, sentences, **kwargs):
+        self.calls.append(len(sentences))
+        return super().encode(sentences, **kwargs)
+
+
+class FlakyEmbedder(HashingEmbedder):
+    """Hashing embedder that raises while `fail` is set."""
+
+    def __init__(self):
+        super().__init__()
+        self.fail = True
+
+    def encode(self, sentences, **kwargs):
+        if self.fail:
+            raise RuntimeError("encoder failed")
+        return super().encode(sentences, **kwargs)
 
 
 @pytest.fixture
@@ -17,23 +52,26 @@ def temp_index_dir():
         yield tmpdir
 
 
-@pytest.fixture
+SAMPLE_SEGMENTS = tuple(MappingProxyType(d) for d in [
+    {
+        "text": "The quick brown fox jumps over the lazy dog.",
+        "meta": {"position": 0, "timestamp": 1.0}
+    },
+    {
+        "text": "Machine learning models require large datasets.",
+        "meta": {"position": 1, "timestamp": 2.0}
+    },
+    {
+        "text": "Neural networks are inspired by biological neurons.",
+        "meta": {"position": 2, "timestamp": 3.0}
+    },
+])
+
+
+@pytest.fixture(scope="module")
 def sample_segments():
     """Provide sample segments for testing."""
-    return [
-        {
-            "text": "The quick brown fox jumps over the lazy dog.",
-            "meta": {"position": 0, "timestamp": 1.0}
-        },
-        {
-            "text": "Machine learning models require large datasets.",
-            "meta": {"position": 1, "timestamp": 2.0}
-        },
-        {
-            "text": "Neural networks are inspired by biological neurons.",
-            "meta": {"position": 2, "timestamp": 3.0}
-        },
-    ]
+    return SAMPLE_SEGMENTS
 
 
 class TestIndexerInitialization:
@@ -102,6 +140,309 @@ class TestIndexerSegmentManagement:
             pytest.skip("Implementation rejects empty segments")
 
 
+class TestIndexerBatching:
+    """Test micro-batched embedding of segments."""
+
+    def test_add_segments_returns_ids(self, sample_segments):
+        """add_segments returns one unique id per segment."""
+        indexer = Indexer()
+        ids = indexer.add_segments(sample_segments)
+        assert len(ids) == len(sample_segments)
+        assert len(set(ids)) == len(ids)
+
+    def test_add_segments_uses_single_encode_call(self, sample_segments):
+        """A bulk add embeds all segments in one call."""
+        embedder = CountingEmbedder()
+        indexer = Indexer(embedder=embedder)
+        indexer.add_segments(sample_segments)
+        assert embedder.calls == [len(sample_segments)]
+
+    def test_add_segment_batches_until_threshold(self, sample_segments):
+        """Single adds are queued until the batch size is reached."""
+        embedder = CountingEmbedder()
+        indexer = Indexer(embedder=embedder, batch_size=3, flush_interval=60.0)
+        indexer.add_segment(sample_segments[0])
+        indexer.add_segment(sample_segments[1])
+        assert embedder.calls == []
+        indexer.add_segment(sample_segments[2])
+        assert embedder.calls == [3]
+
+    def test_pending_segments_are_queryable(self, sample_segments):
+        """Queued segments are flushed before a query runs."""
+        indexer = Indexer(batch_size=100, flush_interval=60.0)
+        for seg in sample_segments:
+            indexer.add_segment(seg)
+        results = indexer.query("fox", top_k=5)
+        assert len(results) == len(sample_segments)
+
+    def test_ids_continue_across_add_methods(self, sample_segments):
+        """Ids stay unique when mixing single and bulk adds."""
+        indexer = Indexer(batch_size=100, flush_interval=60.0)
+        first = indexer.add_segment(sample_segments[0])
+        rest = indexer.add_segments(sample_segments[1:])
+        assert len({first, *rest}) == len(sample_segments)
+
+    @pytest.mark.parametrize("block_size", [0, 4])
+    def test_failed_flush_keeps_segments(self, block_size):
+        """A flush whose embedding fails keeps its segments for the next one."""
+        embedder = FlakyEmbedder()
+        indexer = Indexer(embedder=embedder, batch_size=1, cache=False, block_size=block_size)
+        with pytest.raises(RuntimeError):
+            indexer.add_segment({"text": "first segment"})
+        embedder.fail = False
+        assert indexer.add_segment({"text": "second segment"}) == "1"
+        assert len(indexer._meta) == len(indexer) == 2
+        assert indexer.query("first segment", top_k=1)[0]["text"] == "first segment"
+
+
+class TestIndexerEmbeddingCache:
+    """Test that duplicate segments skip the embedder."""
+
+    def test_duplicate_text_is_encoded_once(self):
+        """Re-adding the same text hits the cache instead of the encoder."""
+        embedder = CountingEmbedder()
+        indexer = Indexer(embedder=embedder)
+        indexer.add_segments([{"text": "system prompt"}])
+        indexer.add_segments([{"text": "system prompt"}, {"text": "new text"}])
+        assert embedder.calls == [1, 1]
+        stats = indexer.stats()
+        assert stats["cache_hits"] == 1
+        assert stats["cache_misses"] == 2
+
+    def test_cache_persists_under_index_path(self, temp_index_dir):
+        """A second indexer on the same path reuses cached embeddings."""
+        Indexer(index_path=temp_index_dir).add_segments([{"text": "shared"}])
+        embedder = CountingEmbedder(dim=384)
+        embedder.model_id = HashingEmbedder(dim=384).model_id
+        indexer = Indexer(index_path=temp_index_dir, embedder=embedder)
+        indexer.add_segments([{"text": "shared"}])
+        assert embedder.calls == []
+        assert indexer.stats()["cache_hits"] == 1
+
+    def test_cache_can_be_disabled(self):
+        """With cache=False every segment is encoded."""
+        embedder = CountingEmbedder()
+        indexer = Indexer(embedder=embedder, cache=False)
+        indexer.add_segments([{"text": "x"}])
+        indexer.add_segments([{"text": "x"}])
+        assert embedder.calls == [1, 1]
+        assert indexer.stats()["cache_hits"] == 0
+
+
+class TestIndexerBlockReuse:
+    """Test block-level deduplication of overlapping segments."""
+
+    PREFIX = "system prompt shared by every turn of the conversation"
+
+    def test_shared_prefix_is_embedded_once(self):
+        """A prefix block shared by two segments is stored once."""
+        embedder = CountingEmbedder()
+        indexer = Indexer(embedder=embedder, block_size=9, cache=False)
+        indexer.add_segments([
+            {"text": f"{self.PREFIX} first question"},
+            {"text": f"{self.PREFIX} second question"},
+        ])
+        # One shared prefix block plus two distinct tails.
+        assert indexer.stats()["vectors"] == 3
+        assert embedder.calls == [3]
+
+    def test_query_returns_segments_not_blocks(self):
+        """Block hits are aggregated back into whole segments."""
+        indexer = Indexer(block_size=4)
+        first = {"text": f"{self.PREFIX} about foxes"}
+        second = {"text": f"{self.PREFIX} about neural networks"}
+        indexer.add_segments([first, second])
+        results = indexer.query("neural networks", top_k=2)
+        assert [r["text"] for r in results] == [second["text"], first["text"]]
+
+    def test_duplicate_segments_share_vectors(self):
+        """Identical segments add no new vectors but remain queryable."""
+        indexer = Indexer(block_size=8)
+        indexer.add_segments([{"text": "same text"}, {"text": "same text"}])
+        assert indexer.stats()["vectors"] == 1
+        assert len(indexer.query("same", top_k=5)) == 2
+
+    def test_block_mapping_persists(self, temp_index_dir):
+        """Block mappings are restored on load."""
+        indexer = Indexer(index_path=temp_index_dir, block_size=4)
+        indexer.add_segments([{"text": f"{self.PREFIX} one"}, {"text": f"{self.PREFIX} two"}])
+        indexer.save()
+        reloaded = Indexer(index_path=temp_index_dir)
+        assert reloaded.block_size == 4
+        reloaded.add_segment({"text": f"{self.PREFIX} three"})
+        reloaded.flush()
+        assert reloaded.stats()["vectors"] == indexer.stats()["vectors"] + 1
+        assert len(reloaded.query("conversation", top_k=5)) == 3
+
+
+class TestIndexerNearDuplicates:
+    """Test SimHash rejection of near-duplicate segments."""
+
+    BASE = " ".join(f"w{i * 13 % 997}" for i in range(200))
+
+    def edited(self):
+        words = self.BASE.split()
+        words[50] = "edited"
+        return " ".join(words)
+
+    def test_near_duplicate_returns_existing_id(self):
+        """A lightly edited segment maps to the original entry and is not embedded."""
+        embedder = CountingEmbedder()
+        indexer = Indexer(embedder=embedder, dedup_distance=4)
+        first = indexer.add_segment({"text": self.BASE})
+        indexer.flush()
+        assert indexer.add_segment({"text": self.edited()}) == first
+        indexer.flush()
+        assert len(indexer) == 1
+        assert embedder.calls == [1]
+
+    def test_distinct_segments_are_kept(self, sample_segments):
+        """Unrelated segments are all indexed."""
+        indexer = Indexer(dedup_distance=4)
+        ids = indexer.add_segments(sample_segments)
+        assert ids == [str(i) for i in range(len(sample_segments))]
+
+    def test_dedup_within_batch(self):
+        """add_segments dedups against segments earlier in the same batch."""
+        indexer = Indexer(dedup_distance=4)
+        ids = indexer.add_segments([{"text": self.BASE}, {"text": "other text"}, {"text": self.edited()}])
+        assert ids == ["0", "1", "0"]
+        assert indexer.stats()["vectors"] == 2
+
+    def test_dedup_disabled_by_default(self):
+        """Without dedup_distance, near-duplicates are indexed separately."""
+        indexer = Indexer()
+        assert indexer.add_segments([{"text": self.BASE}, {"text": self.edited()}]) == ["0", "1"]
+
+    def test_fingerprints_survive_reload(self, temp_index_dir):
+        """A reloaded index still rejects near-duplicates of saved segments."""
+        indexer = Indexer(index_path=temp_index_dir, dedup_distance=4)
+        indexer.add_segments([{"text": "filler"}, {"text": self.BASE}])
+        indexer.save()
+        reloaded = Indexer(index_path=temp_index_dir, dedup_distance=4)
+        assert reloaded.add_segment({"text": self.edited()}) == "1"
+        assert reloaded.add_segment({"text": "new"}) == "2"
+
+
+class TestIndexerQueryCache:
+    """Test the LRU cache of query embeddings."""
+
+    def test_repeated_query_is_embedded_once(self, sample_segments):
+        """The same query text only reaches the encoder once."""
+        embedder = CountingEmbedder()
+        indexer = Indexer(embedder=embedder)
+        indexer.add_segments(sample_segments)
+        embedder.calls.clear()
+        first = indexer.query("lazy dog", top_k=2)
+        second = indexer.query("lazy  dog ", top_k=2)
+        assert embedder.calls == [1]
+        assert first == second
+        stats = indexer.stats()
+        assert (stats["query_cache_hits"], stats["query_cache_misses"]) == (1, 1)
+
+    def test_cached_query_sees_new_segments(self, sample_segments):
+        """Caching the query vector does not hide later additions."""
+        indexer = Indexer()
+        indexer.add_segment(sample_segments[0])
+        assert len(indexer.query("fox", top_k=5)) == 1
+        indexer.add_segment(sample_segments[1])
+        assert len(indexer.query("fox", top_k=5)) == 2
+
+    def test_query_vec_matches_query(self, sample_segments):
+        """query_vec with the embedded text gives the same results as query."""
+        embedder = HashingEmbedder()
+        indexer = Indexer(embedder=embedder)
+        indexer.add_segments(sample_segments)
+        vec = embedder.encode(["neural networks"], normalize_embeddings=True)[0]
+        assert indexer.query_vec(vec, top_k=3) == indexer.query("neural networks", top_k=3)
+
+
+class TestIndexerBackground:
+    """Test indexing on the background worker thread."""
+
+    def test_background_segments_are_searchable(self, sample_segments):
+        """Segments queued in background mode are found after a flush."""
+        indexer = Indexer(background=True)
+        ids = [indexer.add_segment(seg) for seg in sample_segments]
+        assert ids == [str(i) for i in range(len(sample_segments))]
+        indexer.flush()
+        results = indexer.query("lazy dog", top_k=1)
+        assert results[0]["text"] == sample_segments[0]["text"]
+        indexer.close()
+
+    def test_background_batches_match_sync(self, sample_segments):
+        """Background and synchronous indexing give the same results."""
+        sync = Indexer()
+        sync.add_segments(sample_segments)
+        background = Indexer(background=True)
+        background.add_segments(sample_segments)
+        assert background.query("neural networks", top_k=3) == sync.query("neural networks", top_k=3)
+        background.close()
+
+    def test_add_after_close_is_indexed(self, sample_segments):
+        """Once closed, segments are indexed synchronously instead of queued."""
+        indexer = Indexer(background=True)
+        indexer.add_segment(sample_segments[0])
+        indexer.close()
+        assert indexer.add_segment(sample_segments[1]) == "1"
+        indexer.add_segments(sample_segments[2:3])
+        assert len(indexer.query("fox", top_k=5)) == 3
+
+    def test_full_queue_drops_segments(self, sample_segments):
+        """Segments beyond queue_size are dropped and counted, not blocked on."""
+        class SlowEmbedder(HashingEmbedder):
+            def __init__(self):
+                super().__init__()
+                self.release = threading.Event()
+
+            def encode(self, sentences, **kwargs):
+                self.release.wait(5)
+                return super().encode(sentences, **kwargs)
+
+        embedder = SlowEmbedder()
+        indexer = Indexer(embedder=embedder, background=True, queue_size=1, batch_size=1, cache=False)
+        ids = [indexer.add_segment(seg) for seg in sample_segments]
+        embedder.release.set()
+        indexer.close()
+        kept = [i for i in ids if i is not None]
+        assert indexer.stats()["dropped"] == len(ids) - len(kept) > 0
+        assert kept == [str(i) for i in range(len(kept))]
+        assert len(indexer.query("the", top_k=10)) == len(kept)
+
+    def test_worker_error_is_raised_on_flush(self):
+        """An embedder failure on the worker surfaces on the next flush."""
+        embedder = FlakyEmbedder()
+        indexer = Indexer(embedder=embedder, background=True, cache=False)
+        indexer.add_segment({"text": "doomed"})
+        with pytest.raises(RuntimeError, match="encoder failed"):
+            indexer.flush()
+        embedder.fail = False
+        indexer.close()
+
+    def test_failed_segments_keep_their_ids(self):
+        """Segments whose embedding failed are retried and keep their ids."""
+        embedder = FlakyEmbedder()
+        indexer = Indexer(embedder=embedder, background=True, cache=False)
+        assert indexer.add_segment({"text": "first segment"}) == "0"
+        with pytest.raises(RuntimeError):
+            indexer.flush()
+        embedder.fail = False
+        assert indexer.add_segment({"text": "second segment"}) == "1"
+        indexer.flush()
+        assert [indexer._meta[i]["text"] for i in range(len(indexer))] == ["first segment", "second segment"]
+        assert indexer._index.ntotal == len(indexer) == 2
+        indexer.close()
+
+    def test_close_stops_worker(self):
+        """close drains the queue and joins the worker thread."""
+        indexer = Indexer(background=True)
+        thread = indexer._thread
+        indexer.add_segment({"text": "last words"})
+        indexer.close()
+        assert not thread.is_alive()
+        assert indexer.stats()["vectors"] == 1
+
+
 class TestIndexerQuerying:
     """Test query functionality."""
 
@@ -199,25 +540,413 @@ class TestIndexerQuerying:
         assert len(results) == 0
 
 
+class TestIndexerBatchQuery:
+    """Test batched querying."""
+
+    def test_query_batch_matches_single_queries(self, sample_segments):
+        """query_batch returns the same lists as one query per text."""
+        indexer = Indexer()
+        indexer.add_segments(sample_segments)
+        texts = ["lazy dog", "neural networks", "python"]
+        assert indexer.query_batch(texts, top_k=2) == [indexer.query(t, top_k=2) for t in texts]
+
+    def test_query_batch_embeds_once(self, sample_segments):
+        """All query texts are embedded in a single encoder call."""
+        embedder = CountingEmbedder()
+        indexer = Indexer(embedder=embedder)
+        indexer.add_segments(sample_segments)
+        embedder.calls.clear()
+        indexer.query_batch(["a", "b", "c"], top_k=1)
+        assert embedder.calls == [3]
+
+    def test_query_batch_empty(self):
+        """Empty inputs and empty indexes give empty results."""
+        indexer = Indexer()
+        assert indexer.query_batch([], top_k=3) == []
+        assert indexer.query_batch(["x", "y"], top_k=3) == [[], []]
+
+
 class TestIndexerPersistence:
     """Test index persistence (save/load)."""
 
-    def test_save_raises_not_implemented(self, temp_index_dir):
-        """Save method is a stub that raises NotImplementedError."""
-        indexer = Indexer(index_path=temp_index_dir)
-        with pytest.raises(NotImplementedError):
+    def test_save_without_path_raises(self):
+        """Saving an indexer without an index path raises ValueError."""
+        indexer = Indexer()
+        with pytest.raises(ValueError):
             indexer.save()
 
-    def test_load_raises_not_implemented(self, temp_index_dir):
-        """Load method is a stub that raises NotImplementedError."""
+    def test_save_creates_files(self, temp_index_dir, sample_segments):
+        """Save writes index files under the index path."""
+        indexer = Indexer(index_path=temp_index_dir)
+        for seg in sample_segments:
+            indexer.add_segment(seg)
+        indexer.save()
+        assert len(os.listdir(temp_index_dir)) > 0
+
+    def test_save_load_roundtrip(self, temp_index_dir, sample_segments):
+        """A new indexer on a saved path returns the same results."""
+        indexer = Indexer(index_path=temp_index_dir)
+        for seg in sample_segments:
+            indexer.add_segment(seg)
+        indexer.save()
+        expected = indexer.query("fox", top_k=3)
+
+        reloaded = Indexer(index_path=temp_index_dir)
+        results = reloaded.query("fox", top_k=3)
+        assert [r["text"] for r in results] == [r["text"] for r in expected]
+
+    def test_content_fingerprint(self, temp_index_dir, sample_segments):
+        """The fingerprint follows the indexed content and survives a reload."""
         indexer = Indexer(index_path=temp_index_dir)
-        with pytest.raises(NotImplementedError):
-            indexer.load()
+        indexer.add_segments(sample_segments)
+        indexer.save()
+        other = Indexer()
+        other.add_segments([dict(seg, text=seg["text"].upper()) for seg in sample_segments])
+        assert len(other) == len(indexer)
+        assert other.fingerprint() != indexer.fingerprint()
+        os.remove(os.path.join(temp_index_dir, indexer_module.FINGERPRINT_FILE))
+        assert Indexer(index_path=temp_index_dir).fingerprint() == indexer.fingerprint()
+        indexer.save()
+        assert Indexer(index_path=temp_index_dir).fingerprint() == indexer.fingerprint()
+
+    def test_load_then_add(self, temp_index_dir, sample_segments):
+        """Segments can be added after loading an index."""
+        indexer = Indexer(index_path=temp_index_dir)
+        indexer.add_segment(sample_segments[0])
+        indexer.save()
+
+        reloaded = Indexer(index_path=temp_index_dir)
+        new_id = reloaded.add_segment(sample_segments[1])
+        assert new_id != "0"
+        assert len(reloaded.query("learning", top_k=5)) == 2
+
+
+class TestIndexerRanking:
+    """Test that query results are ranked by relevance."""
+
+    def test_query_ranks_matching_segment_first(self, sample_segments):
+        """The segment sharing query terms is ranked first."""
+        indexer = Indexer()
+        for seg in sample_segments:
+            indexer.add_segment(seg)
+
+        results = indexer.query("neural networks neurons", top_k=3)
+        assert results[0]["text"] == sample_segments[2]["text"]
+
+    def test_query_scores_descending(self, sample_segments):
+        """Scores are returned in descending order."""
+        indexer = Indexer()
+        for seg in sample_segments:
+            indexer.add_segment(seg)
+
+        scores = [r["score"] for r in indexer.query("lazy dog", top_k=3)]
+        assert scores == sorted(scores, reverse=True)
+
+    def test_query_returns_metadata(self, sample_segments):
+        """Results carry the metadata of the indexed segment."""
+        indexer = Indexer()
+        indexer.add_segment(sample_segments[1])
+
+        results = indexer.query("machine learning", top_k=1)
+        assert results[0]["meta"] == sample_segments[1]["meta"]
+
+
+class TestIndexerNormalization:
+    """Test that vectors are unit-normalized on insert and at query time."""
+
+    def test_stored_vectors_are_unit_norm(self, sample_segments):
+        """Inserted vectors come back unit-length from the encoder call."""
+        embedder = HashingEmbedder()
+        calls = []
+        encode = embedder.encode
+        embedder.encode = lambda sentences, **kwargs: calls.append(kwargs) or encode(sentences, **kwargs)
+        indexer = Indexer(embedder=embedder, backend="numpy", cache=False)
+        indexer.add_segments(sample_segments)
+        assert calls and all(kwargs["normalize_embeddings"] for kwargs in calls)
+        norms = np.linalg.norm(indexer._index.vectors, axis=1)
+        np.testing.assert_allclose(norms, 1.0, rtol=1e-5)
+
+    def test_embedded_vectors_are_normalized_once(self, sample_segments, monkeypatch):
+        """Only raw vectors passed to query_vec are normalized by the indexer."""
+        calls = []
+        normalize = indexer_module._normalize
+        monkeypatch.setattr(
+            "streaming_llm.rag.indexer._normalize", lambda vecs: calls.append(len(vecs)) or normalize(vecs)
+        )
+        indexer = Indexer(embedder=HashingEmbedder(), cache=False)
+        indexer.add_segments(sample_segments)
+        indexer.query("neural networks", top_k=3)
+        indexer.query_batch(["fox", "datasets"], top_k=3)
+        assert calls == []
+        indexer.query_vec(np.ones(indexer.dim, dtype=np.float32), top_k=3)
+        assert calls == [1]
+
+    def test_query_vec_normalizes_query(self, sample_segments):
+        """Scaling the query vector does not change the scores."""
+        embedder = HashingEmbedder()
+        indexer = Indexer(embedder=embedder)
+        indexer.add_segments(sample_segments)
+        vec = embedder.encode(["neural networks"])[0]
+        raw = vec.copy()
+        scaled = indexer.query_vec(vec * 10.0, top_k=3)
+        assert scaled == indexer.query("neural networks", top_k=3)
+        assert scaled[0]["score"] <= 1.0 + 1e-5
+        np.testing.assert_array_equal(vec, raw)
+
+
+class TestFlatIndex:
+    """Test the contiguous-matrix inner-product index."""
+
+    def test_add_grows_ntotal(self):
+        """Added vectors are counted in ntotal."""
+        index = FlatIndex(4)
+        index.add(np.eye(4, dtype=np.float32))
+        index.add(np.ones((1, 4), dtype=np.float32))
+        assert index.ntotal == 5
+        assert index.vectors.shape == (5, 4)
+
+    def test_search_returns_best_matches_in_order(self):
+        """search returns the highest inner products, best first."""
+        index = FlatIndex(3)
+        index.add(np.array([[1, 0, 0], [0, 1, 0], [0.8, 0.6, 0]], dtype=np.float32))
+        scores, ids = index.search(np.array([[1, 0, 0]], dtype=np.float32), 2)
+        assert ids.tolist() == [[0, 2]]
+        assert scores[0, 0] >= scores[0, 1]
+
+    def test_search_k_larger_than_ntotal(self):
+        """k is capped at the number of stored vectors."""
+        index = FlatIndex(2)
+        index.add(np.eye(2, dtype=np.float32))
+        scores, ids = index.search(np.array([[0, 1]], dtype=np.float32), 10)
+        assert ids.tolist() == [[1, 0]]
+
+    def test_search_empty_index(self):
+        """Searching an empty index returns no hits."""
+        scores, ids = FlatIndex(2).search(np.ones((1, 2), dtype=np.float32), 5)
+        assert ids.shape == (1, 0)
+
+    @pytest.mark.parametrize("dtype", ["float16", "int8"])
+    def test_low_precision_storage(self, dtype):
+        """Low-precision storage keeps scores close to float32."""
+        rng = np.random.default_rng(0)
+        vecs = rng.standard_normal((50, 16)).astype(np.float32)
+        vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+        index = FlatIndex(16, dtype=dtype)
+        index.add(vecs)
+        assert index.vectors.dtype == np.dtype(dtype)
+        scores, ids = index.search(vecs[:1], 1)
+        assert ids[0, 0] == 0
+        assert abs(scores[0, 0] - 1.0) < 0.05
+
+    def test_int8_scores_match_dequantized_dot(self):
+        """int8 scores equal the dot product with the dequantized matrix."""
+        rng = np.random.default_rng(1)
+        vecs = rng.standard_normal((20, 8)).astype(np.float32)
+        vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+        queries = vecs[:3]
+        index = FlatIndex(8, dtype="int8")
+        index.add(vecs)
+        scores, ids = index.search(queries, 20)
+        expected = queries @ (index.vectors.astype(np.float32) / 127.0).T
+        assert np.allclose(scores, np.take_along_axis(expected, ids, axis=1), atol=1e-5)
+
+    def test_unsupported_dtype_raises(self):
+        """Only float32, float16 and int8 storage is supported."""
+        with pytest.raises(ValueError):
+            FlatIndex(4, dtype="float64")
+
+    def test_save_load_roundtrip(self, temp_index_dir):
+        """Vectors survive a save/load cycle."""
+        index = FlatIndex(3)
+        index.add(np.arange(6, dtype=np.float32).reshape(2, 3))
+        path = os.path.join(temp_index_dir, "emb.npy")
+        index.save(path)
+        assert np.array_equal(FlatIndex.load(path).vectors, index.vectors)
+
+
+class TestJsonlMeta:
+    """Test the memory-mapped JSON-lines metadata log."""
+
+    def _paths(self, tmpdir):
+        return os.path.join(tmpdir, "meta.jsonl"), os.path.join(tmpdir, "offsets.npy")
+
+    def test_unsaved_items_are_readable(self):
+        """Appended items are readable before any save."""
+        meta = JsonlMeta()
+        meta.extend([{"text": "a"}, {"text": "b"}])
+        assert len(meta) == 2
+        assert meta[1] == {"text": "b"}
+
+    def test_save_load_roundtrip(self, temp_index_dir):
+        """Saved items are read back by index after loading."""
+        meta = JsonlMeta()
+        meta.extend([{"text": "a"}, {"text": "你好 🚀", "meta": {"k": 1}}])
+        meta.save(*self._paths(temp_index_dir))
+        loaded = JsonlMeta.load(*self._paths(temp_index_dir))
+        assert len(loaded) == 2
+        assert loaded[1] == {"text": "你好 🚀", "meta": {"k": 1}}
+        assert loaded[-2] == {"text": "a"}
+
+    def test_incremental_saves_append(self, temp_index_dir):
+        """Later saves append new items after previously saved ones."""
+        meta = JsonlMeta()
+        meta.append({"text": "first"})
+        meta.save(*self._paths(temp_index_dir))
+        meta.append({"text": "second"})
+        assert meta[0] == {"text": "first"}
+        meta.save(*self._paths(temp_index_dir))
+        loaded = JsonlMeta.load(*self._paths(temp_index_dir))
+        assert [loaded[i]["text"] for i in range(len(loaded))] == ["first", "second"]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+class TestIndexerBackends:
+    """Test behavior shared by every index backend."""
+
+    def test_query_ranks_matching_segment_first(self, backend, sample_segments):
+        """The best-matching segment is ranked first."""
+        indexer = Indexer(backend=backend)
+        indexer.add_segments(sample_segments)
+        results = indexer.query("quick brown fox", top_k=2)
+        assert results[0]["text"] == sample_segments[0]["text"]
+
+    def test_save_load_roundtrip(self, backend, temp_index_dir, sample_segments):
+        """A saved index reloads with the same backend and contents."""
+        indexer = Indexer(index_path=temp_index_dir, backend=backend)
+        indexer.add_segments(sample_segments)
+        indexer.save()
+        reloaded = Indexer(index_path=temp_index_dir, backend=backend)
+        assert len(reloaded) == len(sample_segments)
+        assert reloaded.query("neurons", top_k=1)[0]["text"] == sample_segments[2]["text"]
+
+    def test_save_after_load_keeps_all_segments(self, backend, temp_index_dir, sample_segments):
+        """Saving a loaded (memory-mapped) index again keeps old and new segments."""
+        indexer = Indexer(index_path=temp_index_dir, backend=backend)
+        indexer.add_segments(sample_segments[:2])
+        indexer.save()
+        reloaded = Indexer(index_path=temp_index_dir, backend=backend)
+        reloaded.add_segment(sample_segments[2])
+        reloaded.save()
+        final = Indexer(index_path=temp_index_dir, backend=backend)
+        texts = {r["text"] for r in final.query("the", top_k=10)}
+        assert texts == {seg["text"] for seg in sample_segments}
+
+    @pytest.mark.parametrize("precision", ["float16", "int8"])
+    def test_low_precision_query(self, backend, precision, sample_segments):
+        """Quantized storage still ranks the matching segment first."""
+        indexer = Indexer(backend=backend, precision=precision)
+        indexer.add_segments(sample_segments)
+        results = indexer.query("machine learning datasets", top_k=3)
+        assert results[0]["text"] == sample_segments[1]["text"]
+
+
+@pytest.mark.skipif(faiss is None, reason="faiss not installed")
+class TestIndexerScale:
+    """Test choosing the faiss index structure by corpus size."""
+
+    @staticmethod
+    def _segments(n):
+        return [{"text": f"segment {i} about topic {i % 97} and item {i % 13}"} for i in range(n)]
+
+    @pytest.mark.parametrize("scale, index_type", [("small", "IndexFlat"), ("medium", "IndexHNSWFlat")])
+    def test_fixed_scale_index_type(self, scale, index_type, sample_segments):
+        """Fixed scales build the matching index structure."""
+        indexer = Indexer(backend="faiss", scale=scale)
+        indexer.add_segments(sample_segments)
+        assert type(indexer._index).__name__ == index_type
+        assert indexer.query("quick brown fox", top_k=1)[0]["text"] == sample_segments[0]["text"]
+
+    def test_auto_scale_rebuilds_on_growth(self, monkeypatch):
+        """scale='auto' moves from Flat to HNSW to IVF-PQ as the corpus grows."""
+        monkeypatch.setattr("streaming_llm.rag.indexer.SCALE_LIMITS", {"small": 1500, "medium": 3000})
+        monkeypatch.setattr("streaming_llm.rag.indexer.IVF_MIN_TRAIN", 3000)
+        monkeypatch.setattr("streaming_llm.rag.indexer.PQ_NBITS", 4)  # keep PQ training fast
+        indexer = Indexer(backend="faiss", scale="auto", dim=32)
+        segments = self._segments(4200)
+        indexer.add_segments(segments[:1000])
+        assert type(indexer._index).__name__ == "IndexFlat"
+        indexer.add_segments(segments[1000:2100])
+        indexer._join_rescale()
+        assert type(indexer._index).__name__ == "IndexHNSWFlat"
+        assert indexer.query(segments[7]["text"], top_k=1)[0]["text"] == segments[7]["text"]
+        indexer.add_segments(segments[2100:])
+        indexer._join_rescale()
+        assert type(indexer._index).__name__ == "IndexIVFPQ"
+        assert indexer._index.ntotal == len(segments)
+        assert len(indexer.query("topic 5", top_k=5)) == 5
+
+    def test_scale_survives_reload(self, temp_index_dir, monkeypatch):
+        """A reloaded auto-scaled index keeps its structure and keeps growing."""
+        monkeypatch.setattr("streaming_llm.rag.indexer.SCALE_LIMITS", {"small": 1500, "medium": 10**9})
+        indexer = Indexer(index_path=temp_index_dir, backend="faiss", scale="auto")
+        segments = self._segments(2100)
+        indexer.add_segments(segments[:1000])
+        indexer.save()
+        reloaded = Indexer(index_path=temp_index_dir, backend="faiss", scale="auto")
+        reloaded.add_segments(segments[1000:])
+        reloaded._join_rescale()
+        assert type(reloaded._index).__name__ == "IndexHNSWFlat"
+        assert len(reloaded.query("topic 3", top_k=3)) == 3
+
+    def test_large_scale_survives_reload(self, temp_index_dir, monkeypatch):
+        """A reloaded IVF-PQ index still accepts new segments."""
+        monkeypatch.setattr("streaming_llm.rag.indexer.IVF_MIN_TRAIN", 1000)
+        monkeypatch.setattr("streaming_llm.rag.indexer.PQ_NBITS", 4)  # keep PQ training fast
+        indexer = Indexer(index_path=temp_index_dir, backend="faiss", scale="large", dim=32)
+        segments = self._segments(1200)
+        indexer.add_segments(segments[:1100])
+        indexer._join_rescale()
+        assert type(indexer._index).__name__ == "IndexIVFPQ"
+        indexer.save()
+        reloaded = Indexer(index_path=temp_index_dir, backend="faiss", scale="large", dim=32)
+        reloaded.add_segments(segments[1100:])
+        assert reloaded._index.ntotal == len(segments)
+        assert len(reloaded.query("topic 3", top_k=3)) == 3
+
+    def test_rebuild_runs_off_the_lock(self, monkeypatch):
+        """Adds and queries proceed during a rebuild; their vectors land in the new index."""
+        monkeypatch.setattr("streaming_llm.rag.indexer.SCALE_LIMITS", {"small": 1500, "medium": 10**9})
+        release = threading.Event()
+        make = indexer_module._make_scaled_index
+
+        def slow_make(*args, **kwargs):
+            release.wait(10)
+            return make(*args, **kwargs)
+
+        indexer = Indexer(backend="faiss", scale="auto", dim=32)
+        monkeypatch.setattr("streaming_llm.rag.indexer._make_scaled_index", slow_make)
+        segments = self._segments(2100)
+        indexer.add_segments(segments[:2000])
+        assert indexer._rescaler is not None
+        indexer.add_segments(segments[2000:])
+        assert indexer.query(segments[2050]["text"], top_k=1)[0]["text"] == segments[2050]["text"]
+        release.set()
+        indexer._join_rescale()
+        assert type(indexer._index).__name__ == "IndexHNSWFlat"
+        assert indexer._index.ntotal == len(segments)
+        assert indexer.query(segments[2050]["text"], top_k=1)[0]["text"] == segments[2050]["text"]
+
+    def test_ivf_lists_follow_corpus_size(self):
+        """nlist is 4*sqrt(N) of the corpus, capped by the training sample."""
+        assert indexer_module._ivf_nlist(10_000_000, 10**6) == 4 * 3162
+        assert indexer_module._ivf_nlist(20_000, 20_000) == 20_000 // 39
+
+    def test_scale_requires_faiss_backend(self):
+        """scale is rejected for the numpy backend and for unknown names."""
+        with pytest.raises(ValueError):
+            Indexer(backend="numpy", scale="small")
+        with pytest.raises(ValueError):
+            Indexer(backend="faiss", scale="huge")
 
 
 class TestIndexerEdgeCases:
     """Test edge cases and error conditions."""
 
+    def test_unknown_backend_raises(self):
+        """An unknown backend name is rejected."""
+        with pytest.raises(ValueError):
+            Indexer(backend="annoy")
+
     def test_query_empty_string(self):
         """Query with empty string is handled."""
         indexer = Indexer()
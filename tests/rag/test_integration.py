@@ -6,32 +6,36 @@ Tests are implementation-agnostic and focus on behavior contracts.
 """
 import pytest
 from unittest.mock import Mock, MagicMock, patch
+from types import MappingProxyType
 from streaming_llm.rag.integration import (
     convert_passages_to_inputs,
     reintegrate_passages
 )
 
 
-@pytest.fixture
+SAMPLE_PASSAGES = tuple(MappingProxyType(d) for d in [
+    {
+        "text": "The first passage contains important information.",
+        "score": 0.95,
+        "meta": {"source": "document1"}
+    },
+    {
+        "text": "The second passage provides additional context.",
+        "score": 0.87,
+        "meta": {"source": "document2"}
+    },
+    {
+        "text": "The third passage has supporting details.",
+        "score": 0.72,
+        "meta": {"source": "document3"}
+    },
+])
+
+
+@pytest.fixture(scope="module")
 def sample_passages():
     """Provide sample retrieved passages for testing."""
-    return [
-        {
-            "text": "The first passage contains important information.",
-            "score": 0.95,
-            "meta": {"source": "document1"}
-        },
-        {
-            "text": "The second passage provides additional context.",
-            "score": 0.87,
-            "meta": {"source": "document2"}
-        },
-        {
-            "text": "The third passage has supporting details.",
-            "score": 0.72,
-            "meta": {"source": "document3"}
-        },
-    ]
+    return SAMPLE_PASSAGES
 
 
 @pytest.fixture
@@ -138,6 +142,16 @@ class TestConvertPassagesToInputsEdgeCases:
         except (TypeError, ValueError):
             pytest.skip("Implementation rejects None text")
 
+    def test_convert_none_text_among_passages(self):
+        """None text is treated as empty when joining several passages."""
+        passages = [{"text": None}, {"text": "Kept"}]
+        result = convert_passages_to_inputs(passages)
+        assert result.endswith("Kept")
+
+    def test_convert_single_passage_is_unchanged(self):
+        """A single passage is returned without separators."""
+        assert convert_passages_to_inputs([{"text": "Only"}]) == "Only"
+
     def test_convert_passages_with_unicode(self):
         """Converting passages with Unicode text."""
         passages = [
@@ -206,6 +220,7 @@ class TestConvertPassagesToInputsWithMetadata:
         assert "Second passage" in result
 
 
+@pytest.mark.stub
 class TestReintegratePassagesBasic:
     """Test basic reintegrate_passages functionality."""
 
@@ -224,6 +239,7 @@ class TestReintegratePassagesBasic:
             reintegrate_passages(model, tokenizer, passages)
 
 
+@pytest.mark.stub
 class TestReintegratePassagesSignature:
     """Test the signature and parameters of reintegrate_passages."""
 
@@ -256,6 +272,7 @@ class TestReintegratePassagesSignature:
             reintegrate_passages(mock_model, mock_tokenizer, [])
 
 
+@pytest.mark.stub
 class TestReintegratePassagesVariousInputs:
     """Test reintegrate_passages with various input types."""
 
@@ -347,4 +364,45 @@ class TestConvertPassagesIntegration:
 
         # If all are present, they should maintain order
         if pos_first >= 0 and pos_second >= 0 and pos_third >= 0:
-            assert pos_first < pos_second < pos_third
\ No newline at end of file
+            assert pos_first < pos_second < pos_third
+
+
+class CharTokenizer:
+    """Tokenizer stand-in mapping each character to its code point."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts, add_special_tokens=True):
+        self.calls.append(list(texts))
+        return {"input_ids": [self.encode(t, add_special_tokens) for t in texts]}
+
+    def encode(self, text, add_special_tokens=True):
+        ids = [ord(c) for c in text]
+        return [0] + ids if add_special_tokens else ids
+
+
+class TestConvertPassagesToTokenIds:
+    """Test pre-tokenized output when a tokenizer is given."""
+
+    def test_ids_match_tokenized_text(self, sample_passages):
+        """Token ids equal tokenizing the joined text without special tokens."""
+        tokenizer = CharTokenizer()
+        ids = convert_passages_to_inputs(sample_passages, tokenizer=tokenizer)
+        text = convert_passages_to_inputs(sample_passages)
+        assert ids == tokenizer.encode(text, add_special_tokens=False)
+
+    def test_passages_tokenized_in_one_batch(self, sample_passages):
+        """All passages go to the tokenizer in a single call."""
+        tokenizer = CharTokenizer()
+        convert_passages_to_inputs(sample_passages, tokenizer=tokenizer)
+        convert_passages_to_inputs(sample_passages, tokenizer=tokenizer)
+        assert len(tokenizer.calls) == 2
+        assert len(tokenizer.calls[0]) == len(sample_passages)
+
+    def test_empty_and_missing_text(self):
+        """No passages give no ids; missing text is an empty passage."""
+        tokenizer = CharTokenizer()
+        assert convert_passages_to_inputs([], tokenizer=tokenizer) == []
+        ids = convert_passages_to_inputs([{"text": None}, {"text": "a"}], tokenizer=tokenizer)
+        assert ids == tokenizer.encode("\n\n---\n\na", add_special_tokens=False)
@@ -4,40 +4,52 @@ Tests verify that the Retriever correctly wraps an Indexer and returns
 ranked passages for queries as specified in PRD_RAG-extension.md.
 Tests are implementation-agnostic and focus on behavior contracts.
 """
+import os
+import tempfile
+from types import MappingProxyType
+
 import pytest
 from unittest.mock import Mock, MagicMock
 from streaming_llm.rag.retriever import Retriever
 
+Indexer = pytest.importorskip("streaming_llm.rag.indexer").Indexer
+
+
+_EMPTY = []
+
 
 @pytest.fixture
 def mock_indexer():
     """Create a mock Indexer for testing."""
     indexer = Mock()
     # By default, return empty list
-    indexer.query.return_value = []
+    indexer.query.return_value = _EMPTY
     return indexer
 
 
-@pytest.fixture
+SAMPLE_PASSAGES = tuple(MappingProxyType(d) for d in [
+    {
+        "text": "The lazy dog slept peacefully.",
+        "score": 0.95,
+        "meta": {"position": 5}
+    },
+    {
+        "text": "Fox ran across the field.",
+        "score": 0.87,
+        "meta": {"position": 3}
+    },
+    {
+        "text": "Dog jumped over the fence.",
+        "score": 0.72,
+        "meta": {"position": 7}
+    },
+])
+
+
+@pytest.fixture(scope="module")
 def sample_passages():
     """Provide sample passages that an indexer might return."""
-    return [
-        {
-            "text": "The lazy dog slept peacefully.",
-            "score": 0.95,
-            "meta": {"position": 5}
-        },
-        {
-            "text": "Fox ran across the field.",
-            "score": 0.87,
-            "meta": {"position": 3}
-        },
-        {
-            "text": "Dog jumped over the fence.",
-            "score": 0.72,
-            "meta": {"position": 7}
-        },
-    ]
+    return SAMPLE_PASSAGES
 
 
 class TestRetrieverInitialization:
@@ -55,7 +67,6 @@ class TestRetrieverInitialization:
 
     def test_retriever_init_with_real_indexer(self):
         """Retriever can be initialized with a real Indexer instance."""
-        from streaming_llm.rag.indexer import Indexer
         indexer = Indexer()
         retriever = Retriever(indexer=indexer)
         assert retriever.indexer is indexer
@@ -66,18 +77,18 @@ class TestRetrieverBasicRetrieval:
 
     def test_retrieve_delegates_to_indexer(self, mock_indexer, sample_passages):
         """retrieve delegates to the indexer's query method."""
-        mock_indexer.query.return_value = sample_passages
+        mock_indexer.query.return_value = list(sample_passages)
         retriever = Retriever(indexer=mock_indexer)
 
         results = retriever.retrieve("test query", top_k=5)
 
         # Verify indexer.query was called
         mock_indexer.query.assert_called_once_with("test query", top_k=5)
-        assert results == sample_passages
+        assert results == list(sample_passages)
 
     def test_retrieve_returns_list(self, mock_indexer, sample_passages):
         """retrieve returns a list of passages."""
-        mock_indexer.query.return_value = sample_passages
+        mock_indexer.query.return_value = list(sample_passages)
         retriever = Retriever(indexer=mock_indexer)
 
         results = retriever.retrieve("fox", top_k=5)
@@ -85,34 +96,42 @@ class TestRetrieverBasicRetrieval:
 
     def test_retrieve_with_default_top_k(self, mock_indexer, sample_passages):
         """retrieve uses default top_k=5 when not specified."""
-        mock_indexer.query.return_value = sample_passages
+        mock_indexer.query.return_value = list(sample_passages)
         retriever = Retriever(indexer=mock_indexer)
 
         results = retriever.retrieve("test query")
 
         # Verify top_k=5 was passed to indexer
         mock_indexer.query.assert_called_once_with("test query", top_k=5)
-        assert results == sample_passages
+        assert results == list(sample_passages)
 
-    def test_retrieve_with_custom_top_k(self, mock_indexer, sample_passages):
+    def test_retrieve_with_custom_default_top_k(self, fake_indexer):
+        """default_top_k replaces the default when top_k is not passed."""
+        retriever = Retriever(indexer=fake_indexer, default_top_k=3)
+
+        retriever.retrieve("test query")
+        retriever.retrieve("test query", top_k=7)
+        assert fake_indexer.calls == [("test query", 3), ("test query", 7)]
+
+    def test_retrieve_with_custom_top_k(self, fake_indexer, sample_passages):
         """retrieve passes custom top_k to indexer."""
-        mock_indexer.query.return_value = sample_passages
-        retriever = Retriever(indexer=mock_indexer)
+        fake_indexer.ret = list(sample_passages)
+        retriever = Retriever(indexer=fake_indexer)
 
         results = retriever.retrieve("test query", top_k=10)
 
         # Verify correct top_k was passed
-        mock_indexer.query.assert_called_once_with("test query", top_k=10)
-        assert results == sample_passages
+        assert fake_indexer.calls == [("test query", 10)]
+        assert results == list(sample_passages)
 
     @pytest.mark.parametrize("top_k", [1, 3, 5, 10, 20])
-    def test_retrieve_with_various_top_k(self, mock_indexer, sample_passages, top_k):
+    def test_retrieve_with_various_top_k(self, fake_indexer, sample_passages, top_k):
         """retrieve works with various top_k values."""
-        mock_indexer.query.return_value = sample_passages[:top_k]
-        retriever = Retriever(indexer=mock_indexer)
+        fake_indexer.ret = list(sample_passages[:top_k])
+        retriever = Retriever(indexer=fake_indexer)
 
         results = retriever.retrieve("query", top_k=top_k)
-        mock_indexer.query.assert_called_once_with("query", top_k=top_k)
+        assert fake_indexer.calls == [("query", top_k)]
         assert isinstance(results, list)
 
 
@@ -121,7 +140,7 @@ class TestRetrieverPassageHandling:
 
     def test_retrieve_returns_passages_with_text(self, mock_indexer, sample_passages):
         """Retrieved passages contain text field."""
-        mock_indexer.query.return_value = sample_passages
+        mock_indexer.query.return_value = list(sample_passages)
         retriever = Retriever(indexer=mock_indexer)
 
         results = retriever.retrieve("test", top_k=5)
@@ -130,7 +149,7 @@ class TestRetrieverPassageHandling:
 
     def test_retrieve_returns_passages_with_scores(self, mock_indexer, sample_passages):
         """Retrieved passages may contain relevance scores."""
-        mock_indexer.query.return_value = sample_passages
+        mock_indexer.query.return_value = list(sample_passages)
         retriever = Retriever(indexer=mock_indexer)
 
         results = retriever.retrieve("test", top_k=5)
@@ -142,7 +161,7 @@ class TestRetrieverPassageHandling:
 
     def test_retrieve_returns_passages_with_metadata(self, mock_indexer, sample_passages):
         """Retrieved passages may contain metadata."""
-        mock_indexer.query.return_value = sample_passages
+        mock_indexer.query.return_value = list(sample_passages)
         retriever = Retriever(indexer=mock_indexer)
 
         results = retriever.retrieve("test", top_k=5)
@@ -200,31 +219,29 @@ class TestRetrieverQueryTypes:
         "query-with-special-chars",
         "query with numbers 123",
     ])
-    def test_retrieve_with_various_queries(self, mock_indexer, sample_passages, query):
+    def test_retrieve_with_various_queries(self, fake_indexer, sample_passages, query):
         """retrieve works with various query text formats."""
-        mock_indexer.query.return_value = sample_passages
-        retriever = Retriever(indexer=mock_indexer)
+        fake_indexer.ret = list(sample_passages)
+        retriever = Retriever(indexer=fake_indexer)
 
         results = retriever.retrieve(query, top_k=5)
         assert isinstance(results, list)
-        mock_indexer.query.assert_called_once_with(query, top_k=5)
+        assert fake_indexer.calls == [(query, 5)]
 
-    def test_retrieve_with_empty_query(self, mock_indexer):
+    def test_retrieve_with_empty_query(self, fake_indexer):
         """retrieve handles empty query string."""
-        mock_indexer.query.return_value = []
-        retriever = Retriever(indexer=mock_indexer)
+        retriever = Retriever(indexer=fake_indexer)
 
         results = retriever.retrieve("", top_k=5)
-        mock_indexer.query.assert_called_once_with("", top_k=5)
+        assert fake_indexer.calls == [("", 5)]
         assert isinstance(results, list)
 
-    def test_retrieve_with_unicode_query(self, mock_indexer):
+    def test_retrieve_with_unicode_query(self, fake_indexer):
         """retrieve handles Unicode query strings."""
-        mock_indexer.query.return_value = []
-        retriever = Retriever(indexer=mock_indexer)
+        retriever = Retriever(indexer=fake_indexer)
 
         results = retriever.retrieve("你好世界", top_k=5)
-        mock_indexer.query.assert_called_once_with("你好世界", top_k=5)
+        assert fake_indexer.calls == [("你好世界", 5)]
         assert isinstance(results, list)
 
 
@@ -233,7 +250,6 @@ class TestRetrieverIntegration:
 
     def test_retrieve_with_real_indexer(self):
         """Retriever works with a real Indexer instance."""
-        from streaming_llm.rag.indexer import Indexer
         indexer = Indexer()
         retriever = Retriever(indexer=indexer)
 
@@ -246,7 +262,6 @@ class TestRetrieverIntegration:
 
     def test_retrieve_delegates_exactly_to_indexer(self):
         """Retriever delegates exactly to indexer.query without modification."""
-        from streaming_llm.rag.indexer import Indexer
         indexer = Indexer()
         retriever = Retriever(indexer=indexer)
 
@@ -262,12 +277,223 @@ class TestRetrieverIntegration:
         assert isinstance(indexer_results, list)
 
 
+class KeywordReranker:
+    """Cross-encoder stand-in scoring a passage by shared query words."""
+
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, pairs, batch_size=32):
+        self.batches.append(len(pairs))
+        return [len(set(q.split()) & set(t.split())) for q, t in pairs]
+
+
+class TestRetrieverReranking:
+    """Test two-stage retrieval with a reranker."""
+
+    def test_no_reranker_by_default(self, mock_indexer):
+        """Retriever does not rerank unless a reranker is given."""
+        retriever = Retriever(indexer=mock_indexer)
+        assert retriever.reranker is None
+
+    def test_reranker_overfetches_candidates(self, mock_indexer, sample_passages):
+        """The indexer is asked for top_k * overshoot candidates."""
+        mock_indexer.query.return_value = list(sample_passages)
+        retriever = Retriever(indexer=mock_indexer, reranker=KeywordReranker(), overshoot=4)
+        retriever.retrieve("dog fence", top_k=2)
+        mock_indexer.query.assert_called_once_with("dog fence", top_k=8)
+
+    def test_reranker_reorders_and_truncates(self, mock_indexer, sample_passages):
+        """Candidates are reordered by reranker score and cut to top_k."""
+        mock_indexer.query.return_value = list(sample_passages)
+        reranker = KeywordReranker()
+        retriever = Retriever(indexer=mock_indexer, reranker=reranker)
+
+        results = retriever.retrieve("Dog jumped over the fence.", top_k=2)
+        assert [r["text"] for r in results] == [
+            "Dog jumped over the fence.",
+            "Fox ran across the field.",
+        ]
+        assert results[0]["retrieval_score"] == 0.72
+        assert reranker.batches == [len(sample_passages)]
+
+    def test_reranker_with_no_candidates(self, mock_indexer):
+        """An empty candidate list is returned without calling the reranker."""
+        reranker = KeywordReranker()
+        retriever = Retriever(indexer=mock_indexer, reranker=reranker)
+        assert retriever.retrieve("anything", top_k=3) == []
+        assert reranker.batches == []
+
+
+class TestRetrieverMultiQuery:
+    """Test multi-query retrieval with reciprocal rank fusion."""
+
+    def test_rewrites_are_batched(self, mock_indexer):
+        """The query and its rewrites go to the indexer in one batch."""
+        mock_indexer.query_batch.return_value = [[], []]
+        retriever = Retriever(indexer=mock_indexer, overshoot=5)
+        retriever.retrieve("dog", top_k=2, rewrites=["puppy"])
+        mock_indexer.query_batch.assert_called_once_with(["dog", "puppy"], top_k=10)
+        mock_indexer.query.assert_not_called()
+
+    def test_rrf_prefers_passages_ranked_by_several_queries(self, mock_indexer):
+        """A passage found by every query outranks one found by a single query."""
+        a, b, c = ({"id": i, "text": t, "score": 0.5} for i, t in enumerate("abc"))
+        mock_indexer.query_batch.return_value = [[a, b], [c, b], [c, b]]
+        retriever = Retriever(indexer=mock_indexer)
+        results = retriever.retrieve("q", top_k=2, rewrites=["q1", "q2"])
+        assert [r["text"] for r in results] == ["b", "c"]
+        assert results[0]["score"] == pytest.approx(3 / 62)
+        assert results[0]["retrieval_score"] == 0.5
+
+    def test_rewrites_with_real_indexer(self):
+        """Fusion over a real indexer returns the passage matching the rewrites."""
+        indexer = Indexer()
+        indexer.add_segments([
+            {"id": "1", "text": "the canine chased a ball"},
+            {"id": "2", "text": "stock prices fell sharply"},
+            {"id": "3", "text": "a dog played in the park"},
+        ])
+        retriever = Retriever(indexer=indexer)
+        results = retriever.retrieve("dog", top_k=2, rewrites=["canine", "dog park"])
+        assert {r["id"] for r in results} == {"1", "3"}
+
+
+class TestRetrieverBatch:
+    """Test batched retrieval over several queries."""
+
+    def test_batch_uses_query_batch(self, mock_indexer):
+        """Queries are searched in one query_batch call."""
+        mock_indexer.query_batch.return_value = [[], []]
+        retriever = Retriever(indexer=mock_indexer)
+        assert retriever.retrieve_batch(["a", "b"], top_k=3) == [[], []]
+        mock_indexer.query_batch.assert_called_once_with(["a", "b"], top_k=3)
+        mock_indexer.query.assert_not_called()
+
+    def test_batch_falls_back_to_query(self, fake_indexer, sample_passages):
+        """Indexers without query_batch are queried once per query."""
+        fake_indexer.ret = list(sample_passages)
+        retriever = Retriever(indexer=fake_indexer)
+        results = retriever.retrieve_batch(["a", "b"])
+        assert results == [list(sample_passages)] * 2
+        assert fake_indexer.calls == [("a", 5), ("b", 5)]
+
+    def test_batch_matches_single_queries(self):
+        """Batched results over a real Indexer equal per-query results."""
+        indexer = Indexer()
+        indexer.add_segments([
+            {"id": "1", "text": "the canine chased a ball"},
+            {"id": "2", "text": "stock prices fell sharply"},
+        ])
+        retriever = Retriever(indexer=indexer, cache_size=0)
+        queries = ["dog ball", "stocks"]
+        assert retriever.retrieve_batch(queries, top_k=1) == [retriever.retrieve(q, top_k=1) for q in queries]
+
+
+class TestRetrieverCache:
+    """Test memoization of retrieval results."""
+
+    @staticmethod
+    def _indexer(sample_passages):
+        indexer = MagicMock()
+        indexer.__len__.return_value = 3
+        indexer.fingerprint.return_value = "f" * 64
+        indexer.query.return_value = [dict(p, meta=dict(p["meta"])) for p in sample_passages]
+        return indexer
+
+    def test_repeated_query_hits_cache(self, sample_passages):
+        """The same query and top_k reach the indexer once."""
+        indexer = self._indexer(sample_passages)
+        retriever = Retriever(indexer=indexer)
+        first = retriever.retrieve("q", top_k=3)
+        first[0]["text"] = "mutated"
+        first[0]["meta"]["position"] = -1
+        second = retriever.retrieve("q", top_k=3)
+        assert indexer.query.call_count == 1
+        assert second == list(sample_passages)
+        retriever.retrieve("q", top_k=2)
+        assert indexer.query.call_count == 2
+
+    def test_indexer_growth_invalidates(self, sample_passages):
+        """Adding segments to the indexer makes cached results stale."""
+        indexer = self._indexer(sample_passages)
+        retriever = Retriever(indexer=indexer)
+        retriever.retrieve("q")
+        indexer.__len__.return_value = 4
+        retriever.retrieve("q")
+        assert indexer.query.call_count == 2
+
+    def test_invalidate_and_disable(self, sample_passages):
+        """invalidate clears the cache; cache_size=0 disables it."""
+        indexer = self._indexer(sample_passages)
+        retriever = Retriever(indexer=indexer)
+        retriever.retrieve("q")
+        retriever.invalidate()
+        retriever.retrieve("q")
+        assert indexer.query.call_count == 2
+        uncached = Retriever(indexer=indexer, cache_size=0)
+        uncached.retrieve("q")
+        uncached.retrieve("q")
+        assert indexer.query.call_count == 4
+
+    def test_real_indexer_sees_new_segments(self):
+        """Cached retrieval over a real Indexer still returns later additions."""
+        indexer = Indexer()
+        retriever = Retriever(indexer=indexer)
+        indexer.add_segment({"text": "the fox"})
+        assert len(retriever.retrieve("fox")) == 1
+        indexer.add_segment({"text": "another fox"})
+        assert len(retriever.retrieve("fox")) == 2
+
+
+class TestRetrieverPersistentCache:
+    """Test the dbm-backed result cache."""
+
+    def test_results_survive_restart(self, sample_passages):
+        """A new retriever on the same cache_path answers without the indexer."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "retrieval.cache")
+            indexer = TestRetrieverCache._indexer(sample_passages)
+            retriever = Retriever(indexer=indexer, cache_path=path)
+            assert retriever.retrieve("q", top_k=3) == list(sample_passages)
+            retriever.close()
+
+            restarted = Retriever(indexer=indexer, cache_path=path, cache_size=0)
+            assert restarted.retrieve("q", top_k=3) == list(sample_passages)
+            assert indexer.query.call_count == 1
+            restarted.invalidate()
+            restarted.retrieve("q", top_k=3)
+            assert indexer.query.call_count == 2
+            restarted.close()
+
+    def test_same_size_index_misses_after_restart(self, sample_passages):
+        """An index of the same size but other content does not see old entries."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "retrieval.cache")
+            first = Indexer()
+            first.add_segments([{"text": "red fox"}, {"text": "blue whale"}])
+            retriever = Retriever(indexer=first, cache_path=path)
+            assert retriever.retrieve("fox", top_k=1)[0]["text"] == "red fox"
+            retriever.close()
+
+            other = Indexer()
+            other.add_segments([{"text": "grey fox"}, {"text": "green whale"}])
+            restarted = Retriever(indexer=other, cache_path=path, cache_size=0)
+            assert restarted.retrieve("fox", top_k=1)[0]["text"] == "grey fox"
+            restarted.close()
+
+    def test_disabled_by_default(self, mock_indexer):
+        """Without cache_path nothing is written to disk."""
+        retriever = Retriever(indexer=mock_indexer)
+        assert retriever._dbm is None
+
+
 class TestRetrieverEdgeCases:
     """Test edge cases and error conditions."""
 
     def test_retrieve_very_large_top_k(self, mock_indexer, sample_passages):
         """retrieve handles very large top_k values."""
-        mock_indexer.query.return_value = sample_passages
+        mock_indexer.query.return_value = list(sample_passages)
         retriever = Retriever(indexer=mock_indexer)
 
         results = retriever.retrieve("test", top_k=1000000)
@@ -286,7 +512,7 @@ class TestRetrieverEdgeCases:
 
     def test_retrieve_multiple_queries_same_retriever(self, mock_indexer, sample_passages):
         """Retriever can be used for multiple queries in sequence."""
-        mock_indexer.query.return_value = sample_passages
+        mock_indexer.query.return_value = list(sample_passages)
         retriever = Retriever(indexer=mock_indexer)
 
         results1 = retriever.retrieve("first query", top_k=5)
@@ -7,39 +7,64 @@ Tests are implementation-agnostic and focus on behavior contracts.
 import pytest
 import tempfile
 import os
-from streaming_llm.rag.store import EvictedStore
+import sys
+import threading
+from types import MappingProxyType
+from streaming_llm.rag.store import DICT_FILE, EvictedStore, lz4, zstd
+
+
+# RAM-backed base for store directories, so tests measure the store rather
+# than the disk; override with PYTEST_TMPFS, else the default temp dir is used.
+TMPFS = os.environ.get("PYTEST_TMPFS", "/dev/shm")
+TMPFS = TMPFS if os.path.isdir(TMPFS) and os.access(TMPFS, os.W_OK) else None
 
 
 @pytest.fixture
 def temp_store_dir():
     """Create a temporary directory for store files."""
-    with tempfile.TemporaryDirectory() as tmpdir:
+    with tempfile.TemporaryDirectory(prefix="estore-", dir=TMPFS) as tmpdir:
         yield tmpdir
 
 
 @pytest.fixture
 def evicted_store(temp_store_dir):
     """Create an EvictedStore instance with a temporary directory."""
-    return EvictedStore(path=temp_store_dir)
-
-
-@pytest.fixture
+    return EvictedStore(path=temp_store_dir, durability="relaxed")
+
+
+@pytest.fixture(scope="class")
+def class_store():
+    """Share one EvictedStore across a test class.
+
+    Tests using it only look up the ids they added themselves (or bound
+    counts), so they do not see each other's segments. Tests that need an
+    empty store use `evicted_store`.
+    """
+    with tempfile.TemporaryDirectory(prefix="estore-", dir=TMPFS) as tmpdir:
+        with EvictedStore(path=tmpdir, durability="relaxed") as store:
+            yield store
+
+
+SAMPLE_SEGMENTS = tuple(MappingProxyType(d) for d in [
+    {
+        "text": "First evicted segment with important information.",
+        "meta": {"timestamp": 1.0, "token_range": (0, 100)}
+    },
+    {
+        "text": "Second evicted segment containing context.",
+        "meta": {"timestamp": 2.0, "token_range": (100, 200)}
+    },
+    {
+        "text": "Third evicted segment with additional details.",
+        "meta": {"timestamp": 3.0, "token_range": (200, 300)}
+    },
+])
+
+
+@pytest.fixture(scope="module")
 def sample_segments():
     """Provide sample evicted segments for testing."""
-    return [
-        {
-            "text": "First evicted segment with important information.",
-            "meta": {"timestamp": 1.0, "token_range": (0, 100)}
-        },
-        {
-            "text": "Second evicted segment containing context.",
-            "meta": {"timestamp": 2.0, "token_range": (100, 200)}
-        },
-        {
-            "text": "Third evicted segment with additional details.",
-            "meta": {"timestamp": 3.0, "token_range": (200, 300)}
-        },
-    ]
+    return SAMPLE_SEGMENTS
 
 
 class TestEvictedStoreInitialization:
@@ -67,36 +92,36 @@ class TestEvictedStoreInitialization:
 class TestEvictedStoreSegmentPersistence:
     """Test segment persistence (add_segment)."""
 
-    def test_add_segment_returns_id(self, evicted_store):
+    def test_add_segment_returns_id(self, class_store):
         """Adding a segment returns a non-empty identifier."""
         segment = {"text": "Test segment", "meta": {}}
-        segment_id = evicted_store.add_segment(segment)
+        segment_id = class_store.add_segment(segment)
         assert segment_id is not None
         assert isinstance(segment_id, str)
         assert len(segment_id) > 0
 
-    def test_add_multiple_segments_returns_different_ids(self, evicted_store, sample_segments):
+    def test_add_multiple_segments_returns_different_ids(self, class_store, sample_segments):
         """Adding multiple segments returns different IDs."""
-        ids = [evicted_store.add_segment(seg) for seg in sample_segments]
+        ids = [class_store.add_segment(seg) for seg in sample_segments]
         assert len(ids) == len(sample_segments)
         assert len(set(ids)) == len(ids), "All segment IDs should be unique"
 
-    def test_add_segment_with_text(self, evicted_store):
+    def test_add_segment_with_text(self, class_store):
         """Segments with text content can be persisted."""
         segment = {"text": "Important evicted content"}
-        segment_id = evicted_store.add_segment(segment)
+        segment_id = class_store.add_segment(segment)
         assert segment_id is not None
 
-    def test_add_segment_with_metadata(self, evicted_store):
+    def test_add_segment_with_metadata(self, class_store):
         """Segments with metadata can be persisted."""
         segment = {
             "text": "Content with meta",
             "meta": {"timestamp": 1.5, "source": "llm_generation"}
         }
-        segment_id = evicted_store.add_segment(segment)
+        segment_id = class_store.add_segment(segment)
         assert segment_id is not None
 
-    def test_add_segment_with_complex_metadata(self, evicted_store):
+    def test_add_segment_with_complex_metadata(self, class_store):
         """Segments with complex metadata structures can be persisted."""
         segment = {
             "text": "Complex metadata segment",
@@ -107,82 +132,82 @@ class TestEvictedStoreSegmentPersistence:
                 "tags": ["important", "context"]
             }
         }
-        segment_id = evicted_store.add_segment(segment)
+        segment_id = class_store.add_segment(segment)
         assert segment_id is not None
 
     @pytest.mark.parametrize("text_length", [1, 100, 1000, 10000])
-    def test_add_segment_various_sizes(self, evicted_store, text_length):
+    def test_add_segment_various_sizes(self, class_store, text_length):
         """Segments of various text lengths can be persisted."""
         segment = {"text": "x" * text_length, "meta": {}}
-        segment_id = evicted_store.add_segment(segment)
+        segment_id = class_store.add_segment(segment)
         assert segment_id is not None
 
 
 class TestEvictedStoreSegmentRetrieval:
     """Test segment retrieval (get_segment)."""
 
-    def test_get_segment_returns_dict(self, evicted_store):
+    def test_get_segment_returns_dict(self, class_store):
         """get_segment returns a dictionary."""
         segment = {"text": "Test content", "meta": {"test": True}}
-        segment_id = evicted_store.add_segment(segment)
-        retrieved = evicted_store.get_segment(segment_id)
+        segment_id = class_store.add_segment(segment)
+        retrieved = class_store.get_segment(segment_id)
         assert isinstance(retrieved, dict)
 
-    def test_get_segment_returns_text(self, evicted_store):
+    def test_get_segment_returns_text(self, class_store):
         """Retrieved segment contains the original text."""
         original_text = "Original segment text"
         segment = {"text": original_text, "meta": {}}
-        segment_id = evicted_store.add_segment(segment)
-        retrieved = evicted_store.get_segment(segment_id)
+        segment_id = class_store.add_segment(segment)
+        retrieved = class_store.get_segment(segment_id)
         assert "text" in retrieved
         assert retrieved["text"] == original_text
 
-    def test_get_segment_returns_metadata(self, evicted_store):
+    def test_get_segment_returns_metadata(self, class_store):
         """Retrieved segment contains the original metadata."""
         original_meta = {"timestamp": 1.5, "position": 10}
         segment = {"text": "Content", "meta": original_meta}
-        segment_id = evicted_store.add_segment(segment)
-        retrieved = evicted_store.get_segment(segment_id)
+        segment_id = class_store.add_segment(segment)
+        retrieved = class_store.get_segment(segment_id)
         assert "meta" in retrieved
         assert retrieved["meta"] == original_meta
 
-    def test_get_nonexistent_segment_returns_none(self, evicted_store):
+    def test_get_nonexistent_segment_returns_none(self, class_store):
         """Retrieving a non-existent segment returns None."""
-        result = evicted_store.get_segment("nonexistent_id_12345")
+        result = class_store.get_segment("nonexistent_id_12345")
         assert result is None
 
-    def test_get_segment_after_multiple_additions(self, evicted_store, sample_segments):
+    def test_get_segment_after_multiple_additions(self, class_store, sample_segments):
         """Segment can be retrieved after adding multiple segments."""
-        ids = [evicted_store.add_segment(seg) for seg in sample_segments]
+        ids = class_store.add_segments(sample_segments)
         # Retrieve middle segment
         middle_id = ids[1]
-        retrieved = evicted_store.get_segment(middle_id)
+        retrieved = class_store.get_segment(middle_id)
         assert retrieved is not None
         assert retrieved["text"] == sample_segments[1]["text"]
 
-    def test_get_segment_with_unicode(self, evicted_store):
+    def test_get_segment_with_unicode(self, class_store):
         """Unicode content in segments is preserved on retrieval."""
         unicode_text = "Unicode: 你好世界 مرحبا 🚀"
         segment = {"text": unicode_text, "meta": {}}
-        segment_id = evicted_store.add_segment(segment)
-        retrieved = evicted_store.get_segment(segment_id)
+        segment_id = class_store.add_segment(segment)
+        retrieved = class_store.get_segment(segment_id)
         assert retrieved["text"] == unicode_text
 
-    def test_get_segment_preserves_special_characters(self, evicted_store):
+    def test_get_segment_preserves_special_characters(self, class_store):
         """Special characters in segments are preserved."""
         special_text = "Special: !@#$%^&*()_+-=[]{}|;:',.<>?/\\"
         segment = {"text": special_text, "meta": {}}
-        segment_id = evicted_store.add_segment(segment)
-        retrieved = evicted_store.get_segment(segment_id)
+        segment_id = class_store.add_segment(segment)
+        retrieved = class_store.get_segment(segment_id)
         assert retrieved["text"] == special_text
 
 
 class TestEvictedStoreListingSegments:
     """Test segment listing (list_segments)."""
 
-    def test_list_segments_returns_list(self, evicted_store):
+    def test_list_segments_returns_list(self, class_store):
         """list_segments returns a list."""
-        result = evicted_store.list_segments()
+        result = class_store.list_segments()
         assert isinstance(result, list)
 
     def test_list_segments_empty_store(self, evicted_store):
@@ -191,75 +216,400 @@ class TestEvictedStoreListingSegments:
         assert isinstance(result, list)
         assert len(result) == 0
 
-    def test_list_segments_after_additions(self, evicted_store, sample_segments):
+    def test_list_segments_after_additions(self, class_store, sample_segments):
         """Listing segments after adding segments returns them."""
-        for seg in sample_segments:
-            evicted_store.add_segment(seg)
+        class_store.add_segments(sample_segments)
 
-        result = evicted_store.list_segments()
+        result = class_store.list_segments()
         assert len(result) >= len(sample_segments)
 
-    def test_list_segments_respects_limit(self, evicted_store, sample_segments):
+    def test_list_segments_respects_limit(self, class_store, sample_segments):
         """list_segments respects the limit parameter."""
-        for seg in sample_segments:
-            evicted_store.add_segment(seg)
+        class_store.add_segments(sample_segments)
 
-        result = evicted_store.list_segments(limit=2)
+        result = class_store.list_segments(limit=2)
         assert len(result) <= 2
 
-    def test_list_segments_returns_dicts(self, evicted_store, sample_segments):
+    def test_list_segments_returns_dicts(self, class_store, sample_segments):
         """Segments from list_segments are dictionaries."""
-        for seg in sample_segments:
-            evicted_store.add_segment(seg)
+        class_store.add_segments(sample_segments)
 
-        result = evicted_store.list_segments()
+        result = class_store.list_segments()
         if len(result) > 0:
             for seg in result:
                 assert isinstance(seg, dict)
 
-    def test_list_segments_contains_text(self, evicted_store, sample_segments):
+    def test_list_segments_contains_text(self, class_store, sample_segments):
         """Segments from list_segments contain text."""
-        for seg in sample_segments:
-            evicted_store.add_segment(seg)
+        class_store.add_segments(sample_segments)
 
-        result = evicted_store.list_segments()
+        result = class_store.list_segments()
         if len(result) > 0:
             assert "text" in result[0]
 
-    def test_list_segments_default_limit(self, evicted_store, sample_segments):
+    def test_list_segments_default_limit(self, class_store, sample_segments):
         """list_segments uses default limit of 100."""
         # Add fewer than 100 segments
-        for seg in sample_segments:
-            evicted_store.add_segment(seg)
+        class_store.add_segments(sample_segments)
 
-        result = evicted_store.list_segments()
+        result = class_store.list_segments()
         assert len(result) <= 100
 
     @pytest.mark.parametrize("limit", [1, 5, 10, 50])
-    def test_list_segments_various_limits(self, evicted_store, sample_segments, limit):
+    def test_list_segments_various_limits(self, class_store, sample_segments, limit):
         """list_segments works with various limit values."""
-        for seg in sample_segments:
-            evicted_store.add_segment(seg)
+        class_store.add_segments(sample_segments)
 
-        result = evicted_store.list_segments(limit=limit)
+        result = class_store.list_segments(limit=limit)
         assert len(result) <= limit
 
-    def test_list_segments_order_newest_first(self, evicted_store):
+    def test_list_segments_order_newest_first(self, class_store):
         """list_segments returns segments with newest first (if metadata available)."""
         seg1 = {"text": "First", "meta": {"timestamp": 1.0}}
         seg2 = {"text": "Second", "meta": {"timestamp": 2.0}}
         seg3 = {"text": "Third", "meta": {"timestamp": 3.0}}
 
-        evicted_store.add_segment(seg1)
-        evicted_store.add_segment(seg2)
-        evicted_store.add_segment(seg3)
+        class_store.add_segment(seg1)
+        class_store.add_segment(seg2)
+        class_store.add_segment(seg3)
 
-        result = evicted_store.list_segments(limit=100)
+        result = class_store.list_segments(limit=100)
         # If ordering is preserved, most recent should be first or last
         # (implementation may vary; just verify it returns all)
         assert len(result) >= 3
 
 
+class TestEvictedStorePersistence:
+    """Test durability and batching of the on-disk store."""
+
+    def test_segments_survive_reopen(self, temp_store_dir, sample_segments):
+        """Segments are visible to a new store opened on the same path."""
+        with EvictedStore(path=temp_store_dir) as store:
+            ids = [store.add_segment(seg) for seg in sample_segments]
+
+        reopened = EvictedStore(path=temp_store_dir)
+        assert reopened.get_segment(ids[2])["text"] == sample_segments[2]["text"]
+        assert len(reopened.list_segments()) == len(sample_segments)
+
+    def test_ids_continue_after_reopen(self, temp_store_dir):
+        """Ids issued after reopening do not collide with existing ones."""
+        with EvictedStore(path=temp_store_dir) as store:
+            first = store.add_segment({"text": "a"})
+        with EvictedStore(path=temp_store_dir) as store:
+            second = store.add_segment({"text": "b"})
+        assert first != second
+
+    def test_buffered_segments_are_readable(self, temp_store_dir):
+        """Segments still in the write buffer are returned by reads."""
+        store = EvictedStore(path=temp_store_dir, batch_size=1000)
+        seg_id = store.add_segment({"text": "buffered", "meta": {}})
+        assert store.get_segment(seg_id)["text"] == "buffered"
+
+    def test_get_segment_does_not_flush(self, temp_store_dir):
+        """Reads serve buffered and committed ids without committing the buffer."""
+        store = EvictedStore(path=temp_store_dir, batch_size=1000, flush_interval=60)
+        committed = store.add_segments([{"text": "on disk"}])[0]
+        ids = [store.add_segment({"text": f"buffered {i}", "meta": {"i": i}}) for i in range(3)]
+        assert store.get_segment(ids[1]) == {"id": ids[1], "text": "buffered 1", "meta": {"i": 1}}
+        assert store.get_segment(committed)["text"] == "on disk"
+        assert len(store._pending) == 3
+
+    def test_close_unregisters_exit_flush(self, temp_store_dir, monkeypatch):
+        """Closing a store removes its interpreter-exit hook, and only its own."""
+        hooks = []
+        monkeypatch.setattr("atexit.register", hooks.append)
+        monkeypatch.setattr("atexit.unregister", hooks.remove)
+        kept = EvictedStore(path=os.path.join(temp_store_dir, "kept"))
+        for i in range(3):
+            EvictedStore(path=os.path.join(temp_store_dir, str(i))).close()
+        assert hooks == [kept._atexit]
+        kept.close()
+        assert hooks == []
+
+    def test_list_segments_newest_first(self, evicted_store):
+        """list_segments returns the most recently added segment first."""
+        for text in ("First", "Second", "Third"):
+            evicted_store.add_segment({"text": text, "meta": {}})
+        result = evicted_store.list_segments(limit=2)
+        assert [seg["text"] for seg in result] == ["Third", "Second"]
+
+    @pytest.mark.parametrize("durability,level", [("full", 2), ("normal", 1), ("relaxed", 0)])
+    def test_durability_sets_synchronous(self, temp_store_dir, durability, level):
+        """durability selects SQLite's synchronous level."""
+        store = EvictedStore(path=temp_store_dir, durability=durability)
+        assert store.db.execute("PRAGMA synchronous").fetchone()[0] == level
+
+    def test_unknown_durability_raises(self, temp_store_dir):
+        """An unknown durability is rejected."""
+        with pytest.raises(ValueError):
+            EvictedStore(path=temp_store_dir, durability="none")
+
+    def test_relaxed_store_persists_on_close(self, temp_store_dir):
+        """Segments written without fsync are on disk after close."""
+        with EvictedStore(path=temp_store_dir, durability="relaxed") as store:
+            seg_id = store.add_segment({"text": "relaxed"})
+        assert EvictedStore(path=temp_store_dir).get_segment(seg_id)["text"] == "relaxed"
+
+    def test_reads_use_mmap(self, temp_store_dir):
+        """The database is opened with a memory-mapped read window."""
+        store = EvictedStore(path=temp_store_dir, mmap_size=1 << 20)
+        assert store.db.execute("PRAGMA mmap_size").fetchone()[0] == 1 << 20
+
+    def test_list_segments_tail_of_many(self, temp_store_dir):
+        """list_segments returns only the newest rows of a large store."""
+        with EvictedStore(path=temp_store_dir) as store:
+            for i in range(1000):
+                store.add_segment({"text": f"segment {i}"})
+        store = EvictedStore(path=temp_store_dir)
+        assert [s["text"] for s in store.list_segments(limit=3)] == [
+            "segment 999", "segment 998", "segment 997",
+        ]
+        assert store.get_segment("500")["text"] == "segment 499"
+
+    def test_add_segments_bulk(self, evicted_store, sample_segments):
+        """add_segments persists a batch and returns consecutive ids."""
+        ids = evicted_store.add_segments(sample_segments)
+        assert ids == [str(int(ids[0]) + i) for i in range(len(sample_segments))]
+        assert evicted_store._pending == []
+        assert [evicted_store.get_segment(i)["text"] for i in ids] == [s["text"] for s in sample_segments]
+
+    def test_flush_thresholds(self, temp_store_dir):
+        """The buffer is committed once the byte threshold trips, not before."""
+        store = EvictedStore(path=temp_store_dir, batch_size=1000, flush_bytes=1000,
+                             flush_interval=60, compression=None)
+        store.add_segment({"text": "x" * 100})
+        assert len(store._pending) == 1
+        store.add_segment({"text": "x" * 1000})
+        assert store._pending == []
+        (count,) = store.db.execute("SELECT COUNT(*) FROM segments").fetchone()
+        assert count == 2
+
+    def test_recent_segments_served_from_memory(self, temp_store_dir):
+        """Listing within the recent window neither flushes nor reads the database."""
+        store = EvictedStore(path=temp_store_dir, batch_size=1000, flush_interval=60, recent_size=4)
+        for i in range(6):
+            store.add_segment({"text": f"seg {i}", "meta": {"i": i}})
+        assert [s["text"] for s in store.list_segments(limit=3)] == ["seg 5", "seg 4", "seg 3"]
+        assert len(store._pending) == 6
+        assert [s["meta"]["i"] for s in store.list_segments(limit=6)] == [5, 4, 3, 2, 1, 0]
+        assert store._pending == []
+
+    def test_recent_window_warm_starts(self, temp_store_dir):
+        """A reopened store serves its newest segments from the warm-started cache."""
+        with EvictedStore(path=temp_store_dir) as store:
+            for i in range(10):
+                store.add_segment({"text": f"seg {i}"})
+        store = EvictedStore(path=temp_store_dir, recent_size=3)
+        assert [s["id"] for s in store.list_segments(limit=3)] == ["10", "9", "8"]
+        assert len(store.list_segments(limit=100)) == 10
+
+    def test_extra_fields_are_kept(self, evicted_store):
+        """Fields besides text and meta round-trip with the segment."""
+        seg_id = evicted_store.add_segment({"text": "t", "source": "chat", "tokens": [1, 2]})
+        segment = evicted_store.get_segment(seg_id)
+        assert segment["source"] == "chat"
+        assert segment["tokens"] == [1, 2]
+        assert segment["meta"] == {}
+
+    def test_fields_readable_without_orjson(self, temp_store_dir, monkeypatch):
+        """Fields written with orjson are read back by the stdlib json path and vice versa."""
+        with EvictedStore(path=temp_store_dir) as store:
+            first = store.add_segment({"text": "a", "meta": {"emoji": "🚀", "n": 1.5}})
+        monkeypatch.setattr("streaming_llm.rag.store.orjson", None)
+        store = EvictedStore(path=temp_store_dir)
+        second = store.add_segment({"text": "b", "meta": {"k": "你好"}})
+        assert store.get_segment(first)["meta"] == {"emoji": "🚀", "n": 1.5}
+        assert store.get_segment(second)["meta"] == {"k": "你好"}
+
+    def test_get_segment_includes_id(self, evicted_store):
+        """Retrieved segments carry their id."""
+        seg_id = evicted_store.add_segment({"text": "with id", "meta": {}})
+        assert evicted_store.get_segment(seg_id)["id"] == seg_id
+
+
+@pytest.mark.skipif(zstd is None, reason="zstandard not installed")
+class TestEvictedStoreCompression:
+    """Test Zstd compression of stored text."""
+
+    TEXT = "The user asked about item number {} in the warehouse inventory list today."
+
+    def test_text_is_stored_compressed(self, temp_store_dir):
+        """Stored blobs are smaller than the text and decode back exactly."""
+        store = EvictedStore(path=temp_store_dir)
+        text = self.TEXT.format(0) * 20
+        sid = store.add_segment({"text": text})
+        assert store.get_segment(sid)["text"] == text
+        store.flush()
+        (blob,) = store.db.execute("SELECT text FROM segments").fetchone()
+        assert len(blob) < len(text.encode("utf-8")) / 4
+
+    def test_dictionary_is_trained_and_reused(self, temp_store_dir):
+        """A dictionary is trained after dict_samples segments and reloaded on reopen."""
+        with EvictedStore(path=temp_store_dir, dict_samples=200) as store:
+            for i in range(400):
+                store.add_segment({"text": self.TEXT.format(i)})
+        assert os.path.exists(os.path.join(temp_store_dir, DICT_FILE))
+        store = EvictedStore(path=temp_store_dir)
+        sid = store.add_segment({"text": self.TEXT.format(1000)})
+        assert store.get_segment("1")["text"] == self.TEXT.format(0)
+        assert store.get_segment(sid)["text"] == self.TEXT.format(1000)
+        store.flush()
+        first, last = store.db.execute("SELECT length(text) FROM segments WHERE id IN (1, ?)", (int(sid),))
+        assert last[0] < first[0]
+
+    @pytest.mark.parametrize("compression", [None, "lz4"])
+    def test_existing_dictionary_respects_compression(self, temp_store_dir, compression):
+        """A trained dictionary on disk does not make other codecs compress with zstd."""
+        if compression == "lz4" and lz4 is None:
+            pytest.skip("lz4 not installed")
+        with EvictedStore(path=temp_store_dir, dict_samples=200) as store:
+            for i in range(400):
+                store.add_segment({"text": self.TEXT.format(i)})
+        with EvictedStore(path=temp_store_dir, compression=compression) as store:
+            sid = store.add_segment({"text": "short text"})
+            assert store.get_segment("1")["text"] == self.TEXT.format(0)
+            store.flush()
+            (blob,) = store.db.execute("SELECT text FROM segments WHERE id = ?", (int(sid),)).fetchone()
+        assert blob == b"\x00short text"
+
+    def test_uncompressed_rows_stay_readable(self, temp_store_dir):
+        """Rows written without compression are read back by a compressing store."""
+        with EvictedStore(path=temp_store_dir, compression=None) as store:
+            sid = store.add_segment({"text": "plain"})
+        assert EvictedStore(path=temp_store_dir).get_segment(sid)["text"] == "plain"
+
+    def test_unknown_compression_raises(self, temp_store_dir):
+        """An unknown compression name is rejected."""
+        with pytest.raises(ValueError):
+            EvictedStore(path=temp_store_dir, compression="brotli")
+
+
+@pytest.mark.skipif(lz4 is None, reason="lz4 not installed")
+class TestEvictedStoreLZ4:
+    """Test LZ4 compression of large payloads."""
+
+    def test_large_text_is_lz4_compressed(self, temp_store_dir):
+        """Texts above the threshold are stored as LZ4 frames; small ones raw."""
+        store = EvictedStore(path=temp_store_dir, compression="lz4")
+        big = store.add_segment({"text": "lorem ipsum " * 500})
+        small = store.add_segment({"text": "tiny"})
+        store.flush()
+        sizes = dict(store.db.execute("SELECT id, length(text) FROM segments"))
+        assert sizes[int(big)] < 1000
+        assert sizes[int(small)] == len("tiny") + 1
+        assert EvictedStore(path=temp_store_dir).get_segment(big)["text"] == "lorem ipsum " * 500
+
+    def test_large_fields_are_lz4_compressed(self, temp_store_dir):
+        """Large metadata round-trips through the compressed fields column."""
+        meta = {"tokens": list(range(2000)), "note": "你好 🚀"}
+        with EvictedStore(path=temp_store_dir) as store:
+            seg_id = store.add_segment({"text": "t", "meta": meta})
+            store.flush()
+            (blob,) = store.db.execute("SELECT fields FROM segments").fetchone()
+        assert len(blob) < len(str(meta))
+        store = EvictedStore(path=temp_store_dir)
+        assert store.get_segment(seg_id)["meta"] == meta
+        assert store.list_segments(limit=1)[0]["meta"] == meta
+
+    def test_fields_stay_raw_without_compression(self, temp_store_dir):
+        """compression=None also leaves large serialized fields uncompressed."""
+        meta = {"tokens": list(range(2000))}
+        with EvictedStore(path=temp_store_dir, compression=None) as store:
+            seg_id = store.add_segment({"text": "t", "meta": meta})
+            store.flush()
+            (blob,) = store.db.execute("SELECT fields FROM segments").fetchone()
+            assert blob[:1] == b"{"
+            assert store.get_segment(seg_id)["meta"] == meta
+
+    def test_cached_rows_hold_inflated_fields(self, temp_store_dir):
+        """Repeated gets of a large segment do not decompress its fields again."""
+        meta = {"tokens": list(range(2000))}
+        with EvictedStore(path=temp_store_dir) as store:
+            seg_id = store.add_segment({"text": "t", "meta": meta})
+        store = EvictedStore(path=temp_store_dir)
+        assert store.get_segment(seg_id)["meta"] == meta
+        assert store._get_row(int(seg_id))[2][:1] == b"{"
+        assert store.get_segment(seg_id)["meta"] == meta
+
+
+class TestEvictedStoreReadCache:
+    """Test cached and concurrent get_segment reads."""
+
+    def test_repeated_get_hits_cache(self, evicted_store):
+        """A second lookup of the same id is served from the row cache."""
+        seg_id = evicted_store.add_segment({"text": "cached", "meta": {"k": 1}})
+        evicted_store.flush()
+        first = evicted_store.get_segment(seg_id)
+        first["meta"]["k"] = 2
+        assert evicted_store.get_segment(seg_id) == {"id": seg_id, "text": "cached", "meta": {"k": 1}}
+        assert evicted_store._get_row.cache_info().hits == 1
+
+    def test_unknown_id_is_not_cached(self, evicted_store):
+        """Looking up an id before it exists does not hide it once added."""
+        assert evicted_store.get_segment("1") is None
+        seg_id = evicted_store.add_segment({"text": "late"})
+        assert seg_id == "1"
+        assert evicted_store.get_segment(seg_id)["text"] == "late"
+
+    def test_concurrent_reads_from_threads(self, evicted_store, sample_segments):
+        """Other threads read segments through their own connections."""
+        ids = evicted_store.add_segments(sample_segments * 20)
+        results, errors = {}, []
+
+        def read(offset):
+            try:
+                for seg_id in ids[offset::4]:
+                    results[seg_id] = evicted_store.get_segment(seg_id)["text"]
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=read, args=(i,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert errors == []
+        assert [results[i] for i in ids] == [s["text"] for s in sample_segments * 20]
+        evicted_store.close()
+
+    @pytest.mark.parametrize("name", ["a#b", "a?b", "a b%20"])
+    def test_reads_from_threads_with_uri_characters_in_path(self, temp_store_dir, name):
+        """Other threads open the right database when the path has URI syntax in it."""
+        store = EvictedStore(path=os.path.join(temp_store_dir, name), durability="relaxed")
+        seg_id = store.add_segment({"text": "escaped"})
+        store.flush()
+        results = []
+        reader = threading.Thread(target=lambda: results.append(store.get_segment(seg_id)))
+        reader.start()
+        reader.join()
+        assert results == [{"id": seg_id, "text": "escaped", "meta": {}}]
+        store.close()
+
+    def test_list_segments_while_writing(self, evicted_store):
+        """Listing from the recent window is safe while another thread adds."""
+        evicted_store.add_segments([{"text": f"seed {i}", "meta": {"i": i}} for i in range(1000)])
+        done, errors = threading.Event(), []
+
+        def write():
+            while not done.is_set():
+                evicted_store.add_segment({"text": "concurrent"})
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)  # switch threads often to provoke interleaving
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            for _ in range(200):
+                evicted_store.list_segments(limit=1000)
+        except RuntimeError as e:
+            errors.append(e)
+        finally:
+            done.set()
+            writer.join()
+            sys.setswitchinterval(interval)
+        assert errors == []
+
+
 class TestEvictedStoreEdgeCases:
     """Test edge cases and error conditions."""
 
@@ -4,21 +4,59 @@ Tests verify that the RetrievalTrigger correctly determines when retrieval
 should be invoked during streaming generation as specified in PRD_RAG-extension.md.
 Tests are implementation-agnostic and focus on behavior contracts.
 """
-import pytest
-from unittest.mock import Mock, MagicMock
-from streaming_llm.rag.trigger import RetrievalTrigger
-
-
-@pytest.fixture
-def basic_config():
-    """Provide basic configuration for RetrievalTrigger."""
-    return {
-        "threshold": 0.5,
-        "mode": "entropy"
-    }
-
+from types import MappingProxyType
 
-@pytest.fixture
+import pytest
+from streaming_llm.rag.trigger import RetrievalTrigger, compile_keywords, hyperscan, re2
+
+ENGINES = [
+    pytest.param("hyperscan", marks=pytest.mark.skipif(hyperscan is None, reason="hyperscan not installed")),
+    pytest.param("re2", marks=pytest.mark.skipif(re2 is None, reason="re2 not installed")),
+]
+
+# Shared contexts are read-only so tests stay independent under pytest-xdist.
+_EMPTY_CTX = MappingProxyType({})
+_INIT_CASES = (
+    (None, {}),
+    ({}, {}),
+    ({"threshold": 0.5, "mode": "entropy"}, {"threshold": 0.5, "mode": "entropy"}),
+    (
+        {"threshold": 0.7, "mode": "token_count", "window_size": 100, "check_interval": 10, "enabled": True},
+        {"threshold": 0.7, "mode": "token_count", "window_size": 100, "check_interval": 10, "enabled": True},
+    ),
+)
+_CONTEXT_CASES = tuple(MappingProxyType(c) if isinstance(c, dict) else c for c in (
+    {},
+    {"tokens": []},
+    {"model_state": "active"},
+    {"tokens": [1, 2, 3], "position": 5},
+    {"entropy": 0.8, "threshold": 0.5},
+    None,
+))
+# Simulated context evolution over ten generation steps.
+_EVOLVING_CONTEXTS = tuple(
+    MappingProxyType({"position": p, "tokens_generated": p * 10, "cache_size": 1024 - p * 50})
+    for p in range(1, 11)
+)
+_FIELD_KEYS = tuple(f"field_{i}" for i in range(100))
+_LARGE_CONTEXT = MappingProxyType({
+    "data": tuple(range(10000)),
+    "metadata": MappingProxyType(dict(zip(_FIELD_KEYS, range(100)))),
+})
+
+
+def _is_bool(x) -> bool:
+    """Exact bool check (bool cannot be subclassed)."""
+    return type(x) is bool
+
+
+class _Ctx:
+    """Attribute-style generation context; unset slots read as missing."""
+
+    __slots__ = ("tokens", "position", "recent_text")
+
+
+@pytest.fixture(scope="session")
 def complex_config():
     """Provide complex configuration with multiple parameters."""
     return {
@@ -30,71 +68,41 @@ def complex_config():
     }
 
 
-class TestRetrievalTriggerInitialization:
-    """Test RetrievalTrigger initialization."""
-
-    def test_trigger_init_without_config(self):
-        """RetrievalTrigger can be initialized without configuration."""
-        trigger = RetrievalTrigger()
-        assert trigger is not None
-
-    def test_trigger_init_with_config(self, basic_config):
-        """RetrievalTrigger can be initialized with configuration."""
-        trigger = RetrievalTrigger(config=basic_config)
-        assert trigger is not None
+@pytest.fixture(scope="session")
+def stub_trigger():
+    """Provide one unconfigured trigger; it holds no per-call state."""
+    return RetrievalTrigger()
 
-    def test_trigger_stores_config(self, basic_config):
-        """RetrievalTrigger stores the provided configuration."""
-        trigger = RetrievalTrigger(config=basic_config)
-        assert trigger.config == basic_config
 
-    def test_trigger_init_with_none_config(self):
-        """RetrievalTrigger initializes with empty dict if config is None."""
-        trigger = RetrievalTrigger(config=None)
-        assert trigger.config == {}
+class TestRetrievalTriggerInitialization:
+    """Test RetrievalTrigger initialization."""
 
-    def test_trigger_init_with_complex_config(self, complex_config):
-        """RetrievalTrigger stores complex configuration correctly."""
-        trigger = RetrievalTrigger(config=complex_config)
-        assert trigger.config == complex_config
-        assert trigger.config["threshold"] == 0.7
-        assert trigger.config["mode"] == "token_count"
+    def test_trigger_init_variants(self):
+        """RetrievalTrigger stores its config, defaulting to an empty dict."""
+        assert RetrievalTrigger().config == {}
+        for config, expected in _INIT_CASES:
+            assert RetrievalTrigger(config=config).config == expected, config
 
 
 class TestRetrievalTriggerBasicBehavior:
     """Test basic triggering behavior."""
 
-    def test_should_trigger_returns_bool(self):
+    def test_should_trigger_returns_bool(self, stub_trigger):
         """should_trigger returns a boolean value."""
-        trigger = RetrievalTrigger()
-        result = trigger.should_trigger(context={})
-        assert isinstance(result, bool)
-
-    def test_should_trigger_default_is_false(self):
-        """Default stub implementation returns False."""
-        trigger = RetrievalTrigger()
-        result = trigger.should_trigger(context={})
-        assert result is False
+        result = stub_trigger.should_trigger(context={})
+        assert _is_bool(result)
 
-    def test_should_trigger_with_empty_context(self):
-        """should_trigger handles empty context."""
-        trigger = RetrievalTrigger()
-        result = trigger.should_trigger(context={})
-        assert isinstance(result, bool)
-
-    def test_should_trigger_with_none_context(self):
+    def test_should_trigger_with_none_context(self, stub_trigger):
         """should_trigger handles None context."""
-        trigger = RetrievalTrigger()
-        result = trigger.should_trigger(context=None)
-        assert isinstance(result, bool)
+        result = stub_trigger.should_trigger(context=None)
+        assert _is_bool(result)
 
-    def test_should_trigger_consistency(self):
+    def test_should_trigger_consistency(self, stub_trigger):
         """should_trigger returns consistent results for same context."""
-        trigger = RetrievalTrigger()
         context = {"tokens": [1, 2, 3], "position": 10}
 
-        result1 = trigger.should_trigger(context)
-        result2 = trigger.should_trigger(context)
+        result1 = stub_trigger.should_trigger(context)
+        result2 = stub_trigger.should_trigger(context)
 
         assert result1 == result2
 
@@ -102,39 +110,28 @@ class TestRetrievalTriggerBasicBehavior:
 class TestRetrievalTriggerContextHandling:
     """Test how trigger handles different context types."""
 
-    @pytest.mark.parametrize("context_type", [
-        {},
-        {"tokens": []},
-        {"model_state": "active"},
-        {"tokens": [1, 2, 3], "position": 5},
-        {"entropy": 0.8, "threshold": 0.5},
-        None,
-    ])
-    def test_should_trigger_various_contexts(self, context_type):
+    @pytest.mark.parametrize("context_type", _CONTEXT_CASES)
+    def test_should_trigger_various_contexts(self, stub_trigger, context_type):
         """should_trigger handles various context types."""
-        trigger = RetrievalTrigger()
-        result = trigger.should_trigger(context=context_type)
-        assert isinstance(result, bool)
+        result = stub_trigger.should_trigger(context=context_type)
+        assert _is_bool(result)
 
-    def test_should_trigger_with_dict_context(self):
+    def test_should_trigger_with_dict_context(self, stub_trigger):
         """should_trigger receives dictionary context."""
-        trigger = RetrievalTrigger()
         context = {"type": "model_state", "data": {"tokens": 100}}
-        result = trigger.should_trigger(context)
-        assert isinstance(result, bool)
+        result = stub_trigger.should_trigger(context)
+        assert _is_bool(result)
 
-    def test_should_trigger_with_object_context(self):
+    def test_should_trigger_with_object_context(self, stub_trigger):
         """should_trigger can receive object context."""
-        trigger = RetrievalTrigger()
-        context = Mock()
+        context = _Ctx()
         context.tokens = [1, 2, 3]
         context.position = 5
-        result = trigger.should_trigger(context)
-        assert isinstance(result, bool)
+        result = stub_trigger.should_trigger(context)
+        assert _is_bool(result)
 
-    def test_should_trigger_with_complex_context(self):
+    def test_should_trigger_with_complex_context(self, stub_trigger):
         """should_trigger handles complex context structures."""
-        trigger = RetrievalTrigger()
         context = {
             "model": {
                 "state": "generating",
@@ -150,8 +147,8 @@ class TestRetrievalTriggerContextHandling:
                 "count": 3,
             }
         }
-        result = trigger.should_trigger(context)
-        assert isinstance(result, bool)
+        result = stub_trigger.should_trigger(context)
+        assert _is_bool(result)
 
 
 class TestRetrievalTriggerConfigInfluence:
@@ -172,22 +169,19 @@ class TestRetrievalTriggerConfigInfluence:
     def test_trigger_with_multiple_configs(self, complex_config):
         """Trigger stores all configuration parameters."""
         trigger = RetrievalTrigger(config=complex_config)
-        assert len(trigger.config) == 5
-        assert trigger.config["threshold"] == 0.7
-        assert trigger.config["mode"] == "token_count"
-        assert trigger.config["window_size"] == 100
+        assert trigger.config is complex_config
 
-    def test_trigger_config_does_not_affect_stub(self):
-        """Stub implementation ignores configuration."""
-        config1 = {"threshold": 0.3}
-        config2 = {"threshold": 0.9}
+    def test_empty_config_is_kept_by_reference(self):
+        """An empty config dict is stored as given, not replaced by a new one."""
+        config = {}
+        assert RetrievalTrigger(config=config).config is config
 
-        trigger1 = RetrievalTrigger(config=config1)
-        trigger2 = RetrievalTrigger(config=config2)
-
-        # Both return False in stub implementation
-        assert trigger1.should_trigger({}) is False
-        assert trigger2.should_trigger({}) is False
+    @pytest.mark.stub
+    def test_trigger_config_does_not_affect_stub(self):
+        """Without patterns, retrieval is never triggered whatever the config."""
+        assert RetrievalTrigger().should_trigger(_EMPTY_CTX) is False
+        assert RetrievalTrigger(config={"threshold": 0.3}).should_trigger(_EMPTY_CTX) is False
+        assert RetrievalTrigger(config={"threshold": 0.9}).should_trigger(_EMPTY_CTX) is False
 
 
 class TestRetrievalTriggerMultipleInstances:
@@ -215,8 +209,8 @@ class TestRetrievalTriggerMultipleInstances:
         result1 = trigger1.should_trigger(context)
         result2 = trigger2.should_trigger(context)
 
-        assert isinstance(result1, bool)
-        assert isinstance(result2, bool)
+        assert _is_bool(result1)
+        assert _is_bool(result2)
 
 
 class TestRetrievalTriggerSequentialCalls:
@@ -226,61 +220,33 @@ class TestRetrievalTriggerSequentialCalls:
         """Same trigger instance can be called multiple times."""
         trigger = RetrievalTrigger(config={"mode": "entropy"})
 
-        contexts = [
-            {"position": 1},
-            {"position": 2},
-            {"position": 3},
-        ]
-
-        results = [trigger.should_trigger(ctx) for ctx in contexts]
-
-        assert len(results) == 3
-        assert all(isinstance(r, bool) for r in results)
+        calls = 0
+        for context in ({"position": 1}, {"position": 2}, {"position": 3}):
+            assert _is_bool(trigger.should_trigger(context))
+            calls += 1
+        assert calls == 3
 
     def test_trigger_with_evolving_context(self):
         """Trigger can handle evolving context over time."""
         trigger = RetrievalTrigger()
 
-        # Simulate context evolution
-        for position in range(1, 11):
-            context = {
-                "position": position,
-                "tokens_generated": position * 10,
-                "cache_size": 1024 - (position * 50),
-            }
-            result = trigger.should_trigger(context)
-            assert isinstance(result, bool)
+        for context in _EVOLVING_CONTEXTS:
+            assert _is_bool(trigger.should_trigger(context))
 
 
 class TestRetrievalTriggerEdgeCases:
     """Test edge cases and boundary conditions."""
 
-    def test_trigger_with_empty_config(self):
-        """Trigger works with empty configuration dict."""
-        trigger = RetrievalTrigger(config={})
-        result = trigger.should_trigger({})
-        assert isinstance(result, bool)
+    @pytest.mark.parametrize("config", [None, {}, {"threshold": 0.0, "max_retries": 0, "timeout": None}])
+    def test_trigger_accepts_edge_configs(self, config):
+        """Trigger works with missing, empty and zero/None-valued configuration."""
+        trigger = RetrievalTrigger(config=config)
+        assert _is_bool(trigger.should_trigger(_EMPTY_CTX))
 
-    def test_trigger_with_large_context(self):
+    def test_trigger_with_large_context(self, stub_trigger):
         """Trigger handles large context structures."""
-        trigger = RetrievalTrigger()
-        large_context = {
-            "data": [i for i in range(10000)],
-            "metadata": {f"field_{i}": i for i in range(100)},
-        }
-        result = trigger.should_trigger(large_context)
-        assert isinstance(result, bool)
-
-    def test_trigger_with_special_config_values(self):
-        """Trigger handles special configuration values."""
-        config = {
-            "threshold": 0.0,
-            "max_retries": 0,
-            "timeout": None,
-        }
-        trigger = RetrievalTrigger(config=config)
-        result = trigger.should_trigger({})
-        assert isinstance(result, bool)
+        result = stub_trigger.should_trigger(_LARGE_CONTEXT)
+        assert _is_bool(result)
 
     def test_trigger_config_mutation_does_not_affect_instance(self):
         """Mutating config dict after init doesn't affect behavior."""
@@ -293,20 +259,62 @@ class TestRetrievalTriggerEdgeCases:
         # Trigger's config may or may not be affected (implementation-dependent)
         # But should still return a valid boolean
         result = trigger.should_trigger({})
-        assert isinstance(result, bool)
+        assert _is_bool(result)
 
-    @pytest.mark.parametrize("threshold", [0.0, 0.1, 0.5, 0.9, 1.0])
-    def test_trigger_with_various_thresholds(self, threshold):
+    def test_trigger_with_various_thresholds(self):
         """Trigger accepts various threshold values."""
-        config = {"threshold": threshold}
-        trigger = RetrievalTrigger(config=config)
-        result = trigger.should_trigger({})
-        assert isinstance(result, bool)
+        for threshold in (0.0, 0.1, 0.5, 0.9, 1.0):
+            trigger = RetrievalTrigger(config={"threshold": threshold})
+            assert _is_bool(trigger.should_trigger(_EMPTY_CTX)), threshold
 
-    @pytest.mark.parametrize("mode", ["entropy", "token_count", "confidence", "memory", "custom"])
-    def test_trigger_with_various_modes(self, mode):
+    def test_trigger_with_various_modes(self):
         """Trigger accepts various mode values."""
-        config = {"mode": mode}
-        trigger = RetrievalTrigger(config=config)
-        result = trigger.should_trigger({})
-        assert isinstance(result, bool)
\ No newline at end of file
+        for mode in ("entropy", "token_count", "confidence", "memory", "custom"):
+            trigger = RetrievalTrigger(config={"mode": mode})
+            assert _is_bool(trigger.should_trigger(_EMPTY_CTX)), mode
+
+
+class TestRetrievalTriggerKeywords:
+    """Test the keyword prefilter over recent generation text."""
+
+    PATTERNS = ["according to", r"\?", "as reported by"]
+
+    @pytest.mark.parametrize("engine", ENGINES)
+    def test_keyword_match_triggers(self, engine):
+        """A trigger phrase in recent_text triggers retrieval, case-insensitively."""
+        trigger = RetrievalTrigger(config={"patterns": self.PATTERNS, "keyword_engine": engine})
+        assert trigger.should_trigger({"recent_text": "Revenue grew, According To the filing"}) is True
+        assert trigger.should_trigger({"recent_text": "Who wrote it?"}) is True
+        assert trigger.should_trigger({"recent_text": "Nothing to see here."}) is False
+
+    @pytest.mark.parametrize("engine", ENGINES)
+    def test_compile_keywords_engines_agree(self, engine):
+        """Every engine gives the same answers on the same texts."""
+        matches = compile_keywords(self.PATTERNS, engine)
+        texts = ["as REPORTED by Reuters", "plain text", "", "why?"]
+        assert [matches(t) for t in texts] == [True, False, False, True]
+
+    @pytest.mark.skipif(hyperscan is None and re2 is None, reason="no keyword engine installed")
+    def test_only_scan_window_is_scanned(self):
+        """Phrases before the trailing scan_window are ignored."""
+        trigger = RetrievalTrigger(config={"patterns": ["according to"], "scan_window": 20})
+        text = "according to someone" + " filler" * 10
+        assert trigger.should_trigger({"recent_text": text}) is False
+        assert trigger.should_trigger({"recent_text": text + " according to"}) is True
+
+    @pytest.mark.skipif(hyperscan is None and re2 is None, reason="no keyword engine installed")
+    def test_object_context_and_missing_text(self):
+        """recent_text is read from attributes; missing text never triggers."""
+        trigger = RetrievalTrigger(config={"patterns": ["according to"]})
+        context = _Ctx()
+        context.recent_text = "according to the docs"
+        assert trigger.should_trigger(context) is True
+        assert trigger.should_trigger(_Ctx()) is False
+        assert trigger.should_trigger(MappingProxyType({"recent_text": "according to X"})) is True
+        assert trigger.should_trigger({}) is False
+        assert trigger.should_trigger(None) is False
+
+    def test_unknown_engine_raises(self):
+        """An unknown keyword engine is rejected."""
+        with pytest.raises(ValueError):
+            RetrievalTrigger(config={"patterns": ["x"], "keyword_engine": "re"})